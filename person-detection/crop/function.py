@@ -1,16 +1,58 @@
 import base64
 import time
 import io
+import os
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-import minioclient
+import storage
+import imgref
+import metrics
 
+# Crops of a frame are uploaded concurrently, sharing the store (and its connection pool)
+UPLOAD_WORKERS = int(os.getenv("CROP_UPLOAD_WORKERS", "8"))
+_upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+# Print each crop and upload (disabled when the executor output is "quiet")
+VERBOSE = os.getenv("EXECUTOR_LOG_LEVEL", "info").lower() != "quiet"
 
-def extract_person_crops(base64_string, person_bboxes, padding=0):
+
+def parse_box(detection):
+    """
+    Parse a bounding box received from the detector.
+
+    Args:
+        detection (list or str): [x1, y1, x2, y2] numbers, or a "x1,y1,x2,y2" string (older detectors)
+
+    Returns:
+        list: [x1, y1, x2, y2] floats
+    """
+    if isinstance(detection, str):
+        detection = detection.split(",")
+    return [float(x) for x in detection]
+
+
+def unletterbox(box, scale, pad_x, pad_y):
+    """
+    Map a box from the letterboxed frame of the detector to the original image.
+
+    Args:
+        box (list): [x1, y1, x2, y2] in frame coordinates
+        scale (float): Scale factor from the original image to the frame
+        pad_x (int): Left padding of the frame
+        pad_y (int): Top padding of the frame
+
+    Returns:
+        list: [x1, y1, x2, y2] in original image coordinates
     """
-    Extract cropped images for each person bounding box from a base64-encoded image.
+    x1, y1, x2, y2 = box
+    return [(x1 - pad_x) / scale, (y1 - pad_y) / scale, (x2 - pad_x) / scale, (y2 - pad_y) / scale]
+
+
+def extract_person_crops(image, person_bboxes, padding=0):
+    """
+    Extract cropped images for each person bounding box from an encoded image.
     
     Args:
-        base64_string (str): Base64-encoded image string
+        image (str or bytes): Base64-encoded image string, or raw image bytes
         person_bboxes (list): List of bounding boxes in format [x1, y1, x2, y2]
                              or list of dicts with 'bbox' key
         padding (int): Extra pixels to add around each crop (default: 0)
@@ -18,12 +60,16 @@ def extract_person_crops(base64_string, person_bboxes, padding=0):
     Returns:
         list: List of PIL Image objects, one for each person
     """
-    # Remove data URL prefix if present
-    if ',' in base64_string:
-        base64_string = base64_string.split(',')[1]
-    
-    # Decode base64 to image
-    img_bytes = base64.b64decode(base64_string)
+    if isinstance(image, str):
+        # Remove data URL prefix if present
+        if ',' in image:
+            image = image.split(',')[1]
+        
+        # Decode base64 to image
+        with metrics.timed("base64_decode"):
+            img_bytes = base64.b64decode(image)
+    else:
+        img_bytes = image
     img = Image.open(io.BytesIO(img_bytes))
     img_width, img_height = img.size
     
@@ -48,54 +94,78 @@ def extract_person_crops(base64_string, person_bboxes, padding=0):
         cropped = img.crop((x1, y1, x2, y2))
         cropped_images.append(cropped)
         
-        print(f"Person {i+1}: Cropped region ({x1}, {y1}) to ({x2}, {y2}), size: {x2-x1}x{y2-y1}")
+        if VERBOSE:
+            print(f"Person {i+1}: Cropped region ({x1}, {y1}) to ({x2}, {y2}), size: {x2-x1}x{y2-y1}")
     
     return cropped_images
 
 
-def save_person_crops(base64_string, person_bboxes, output_prefix="person", padding=0):
+def save_person_crops(image, person_bboxes, output_prefix="person", padding=0):
     """
-    Extract and save cropped images for each person bounding box.
+    Extract and upload cropped images for each person bounding box.
+
+    Crops are encoded in memory and uploaded concurrently.
     
     Args:
-        base64_string (str): Base64-encoded image string
+        image (str or bytes): Base64-encoded image string, or raw image bytes
         person_bboxes (list): List of bounding boxes
-        output_prefix (str): Prefix for output filenames (default: "person")
+        output_prefix (str): Prefix for object names (default: "person")
         padding (int): Extra pixels to add around each crop (default: 0)
     
     Returns:
-        list: List of saved filenames
+        list: List of saved object names
     """
-    cropped_images = extract_person_crops(base64_string, person_bboxes, padding)
+    cropped_images = extract_person_crops(image, person_bboxes, padding)
 
-    minioclient.ensure_bucket()
-    
-    saved_files = []
+    timestamp = time.time()
+    uploads = []
     for i, crop in enumerate(cropped_images, 1):
-        filename = f"{output_prefix}_{i}.jpg"
-        crop.save(filename, quality=95)
+        buffer = io.BytesIO()
+        crop.save(buffer, format='JPEG', quality=95)
 
-        object_name=str(time.time())+".jpg"
-        minioclient.upload_file(filename, object_name)
+        object_name = f"{timestamp}_{output_prefix}_{i}.jpg"
+        upload = _upload_pool.submit(storage.store.put, object_name, buffer.getvalue(),
+                                     content_type="image/jpeg")
+        uploads.append((object_name, upload))
+    
+    saved_files = []
+    for object_name, upload in uploads:
+        upload.result()
         saved_files.append(object_name)
-        print(f"Saved: {object_name}")
+        if VERBOSE:
+            print(f"Saved: {object_name}")
     
     return saved_files
 
 
+def get_stats():
+    """Storage usage (reported by the executor)"""
+    return {"Storage": storage.store.get_stats()}
+
+
 def handler (params, context):
-    if not "Img" in params or not "Detections" in params:
+    if not "Detections" in params:
+        return {"Status": False}
+
+    if "ImgKey" in params:
+        # Image passed by reference: fetch it only now that it is needed
+        img = imgref.get_image(params["ImgKey"], params.get("ImgHash"))
+    elif "Img" in params:
+        img = params["Img"]
+    else:
         return {"Status": False}
 
-    img = params["Img"]
-    boxes = []
-    for d in params["Detections"]:
-        box = [float(x) for x in d.split(",")]
-        boxes.append(box)
+    boxes = [parse_box(d) for d in params["Detections"]]
+    if "Scale" in params:
+        # Boxes detected on a letterboxed frame: crop the original image
+        boxes = [unletterbox(box, params["Scale"], params["PadX"], params["PadY"]) for box in boxes]
 
     response = {}
 
     objects = save_person_crops(img, boxes, output_prefix="person", padding=10)
+    if "ImgKey" in params:
+        # Last stage of the workflow
+        imgref.delete_image(params["ImgKey"])
     
     response["Objects"] = objects
 
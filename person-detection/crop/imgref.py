@@ -0,0 +1,114 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+import storage
+
+# Directory shared by colocated stages (e.g., a tmpfs mount).
+# If not set, images are kept in the store selected by STORAGE_BACKEND.
+IMG_STORE_DIR = os.getenv("IMG_STORE_DIR", "")
+IMG_PREFIX    = os.getenv("IMG_PREFIX", "frames/")
+# Delete each frame once the last stage that needs it has read it
+IMG_CLEANUP   = os.getenv("IMG_CLEANUP", "true").lower() == "true"
+# Frames in IMG_STORE_DIR older than this many seconds are removed, e.g., those of
+# failed invocations (0: never). For object stores, use a lifecycle rule on IMG_PREFIX
+IMG_TTL       = float(os.getenv("IMG_TTL", "600"))
+
+_store = storage.LocalStore(IMG_STORE_DIR) if IMG_STORE_DIR else storage.store
+
+
+# Content type of the stored images, by extension ("raw": RGB pixels, "bin": images in other formats)
+CONTENT_TYPES = {"jpg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp",
+                 "bmp": "image/bmp", "tiff": "image/tiff", "raw": "application/octet-stream",
+                 "bin": "application/octet-stream"}
+# Keys of the images stored by put_image: other keys (e.g., of files outside IMG_PREFIX) are rejected
+KEY_PATTERN = re.compile(rf"{re.escape(IMG_PREFIX)}[0-9a-f]{{64}}-[0-9a-f]{{32}}\.({'|'.join(CONTENT_TYPES)})")
+
+
+def check_key(key):
+    """Raise an exception unless key is the key of an image stored with put_image"""
+    if not isinstance(key, str) or not KEY_PATTERN.fullmatch(key):
+        raise Exception(f"Invalid image key: {key!r}")
+
+
+def put_image(img_bytes, ext="jpg"):
+    """
+    Store an encoded image, so that later stages can refer to it by key.
+    Every call stores a new object, deleted by the last stage that reads it:
+    identical images of concurrent invocations do not share a key.
+
+    Args:
+        img_bytes (bytes): Encoded image
+        ext (str): Extension of the key, i.e., the format of the image: "jpg" (default), "png", "raw", ...
+                   (see CONTENT_TYPES)
+
+    Returns:
+        tuple: (key, hash) where hash is the SHA-256 of the content
+    """
+    digest = hashlib.sha256(img_bytes).hexdigest()
+    key = f"{IMG_PREFIX}{digest}-{uuid.uuid4().hex}.{ext}"
+    check_key(key)
+    _store.put(key, img_bytes, content_type=CONTENT_TYPES[ext])
+    if IMG_STORE_DIR and IMG_TTL > 0:
+        expire_local()
+    return key, digest
+
+
+def get_image(key, digest=None):
+    """
+    Fetch an image stored with put_image.
+
+    Args:
+        key (str): Image key
+        digest (str, optional): Expected SHA-256 of the content
+
+    Returns:
+        bytes: Encoded image
+    """
+    check_key(key)
+    img_bytes = _store.get(key)
+    if digest and hashlib.sha256(img_bytes).hexdigest() != digest:
+        raise Exception(f"Image {key} does not match hash {digest}")
+    return img_bytes
+
+
+def delete_image(key):
+    """
+    Delete an image stored with put_image, once no later stage needs it.
+
+    Args:
+        key (str): Image key
+    """
+    check_key(key)
+    if not IMG_CLEANUP:
+        return
+    try:
+        _store.delete(key)
+    except Exception as e:
+        print(f"Cannot delete image {key}: {e}")
+
+
+_last_expiration = 0.0
+_expiration_lock = threading.Lock()
+
+
+def expire_local(now=None):
+    """Remove the frames in IMG_STORE_DIR older than IMG_TTL (at most once every IMG_TTL / 10 seconds)"""
+    global _last_expiration
+    now = now or time.time()
+    with _expiration_lock:
+        if now - _last_expiration < IMG_TTL / 10:
+            return
+        _last_expiration = now
+    try:
+        entries = list(os.scandir(os.path.join(IMG_STORE_DIR, IMG_PREFIX)))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and now - entry.stat().st_mtime > IMG_TTL:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
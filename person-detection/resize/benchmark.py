@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+""" Compare the throughput of the resize modes for several input resolutions.
+
+Usage: python3 benchmark.py [input.json] [max_size] [runs]
+
+The test images are obtained by scaling the image in input.json (default: the
+one in this directory) to each resolution and encoding it as JPEG. Each mode is
+run `runs` times per image; the best time is reported.
+"""
+import base64
+import io
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("EXECUTOR_LOG_LEVEL", "quiet")
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from PIL import Image
+
+import function
+
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080), (2560, 1440), (3840, 2160)]
+
+MODES = {
+    "default": dict(fast=False, resample="lanczos"),
+    "fast": dict(fast=True, resample="lanczos"),
+    "fast-bilinear": dict(fast=True, resample="bilinear"),
+}
+
+
+def make_jpeg(img, size):
+    buffer = io.BytesIO()
+    img.resize(size, Image.Resampling.LANCZOS).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def best_time(img_bytes, max_size, runs, **mode):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        function.resize_image_bytes(img_bytes, max_size, **mode)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    input_file = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "input.json")
+    max_size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    with open(input_file) as f:
+        b64 = json.load(f)["img"]
+    if "," in b64:
+        b64 = b64.split(",")[1]
+    source = Image.open(io.BytesIO(base64.b64decode(b64))).convert("RGB")
+
+    print(f"{'resolution':<12}" + "".join(f"{name + ' (img/s)':>22}" for name in MODES))
+    for size in RESOLUTIONS:
+        img_bytes = make_jpeg(source, size)
+        throughput = [1 / best_time(img_bytes, max_size, runs, **mode) for mode in MODES.values()]
+        print(f"{size[0]}x{size[1]:<7}" + "".join(f"{t:>22.1f}" for t in throughput))
+
+
+if __name__ == "__main__":
+    main()
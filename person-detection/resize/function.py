@@ -1,52 +1,210 @@
 # pip install ultralytics pillow numpy
 import base64
 import io
+import os
 from PIL import Image
+import imgref
+import metrics
 
-def resize_base64_image(base64_string, max_size=500):
+
+def resampling_filter(resample):
+    """Pillow resampling filter with the given name (e.g., "lanczos"); filters are returned as they are"""
+    if isinstance(resample, Image.Resampling):
+        return resample
+    try:
+        return Image.Resampling[resample.upper()]
+    except KeyError:
+        names = ", ".join(f.name.lower() for f in Image.Resampling)
+        raise ValueError(f"Unknown resampling filter {resample!r} (expected one of: {names})") from None
+
+
+# Store the resized image and pass only its key to the next stages
+BY_REF = os.getenv("IMG_BY_REF", "false").lower() == "true"
+# Print the size of each image (disabled when the executor output is "quiet")
+VERBOSE = os.getenv("EXECUTOR_LOG_LEVEL", "info").lower() != "quiet"
+# Decode JPEGs directly at the smallest scale (1/2, 1/4, 1/8) not below the target size
+FAST = os.getenv("RESIZE_FAST", "false").lower() == "true"
+# Resampling filter (nearest, box, bilinear, hamming, bicubic, lanczos) and JPEG quality of resized images
+FILTER = resampling_filter(os.getenv("RESIZE_FILTER", "lanczos"))
+QUALITY = int(os.getenv("RESIZE_QUALITY", "95"))
+# "thumbnail": fit within 500x500 and encode as JPEG; "letterbox": produce the input frame of the detector
+MODE = os.getenv("RESIZE_MODE", "thumbnail").lower()
+# Side of the letterboxed frame (the input size of the detector) and its lossless encoding: "png" or "raw" (RGB pixels)
+LETTERBOX_SIZE = int(os.getenv("RESIZE_LETTERBOX_SIZE", "640"))
+LETTERBOX_FORMAT = os.getenv("RESIZE_LETTERBOX_FORMAT", "png").lower()
+
+def resize_image_bytes(img_bytes, max_size=500, fast=FAST, resample=FILTER, quality=QUALITY):
     """
-    Resize a base64-encoded image to fit within max_size x max_size while preserving aspect ratio.
+    Resize an encoded image to fit within max_size x max_size while preserving aspect ratio.
+
+    Images already within max_size are returned untouched. In fast mode, JPEGs
+    are decoded directly at a reduced scale (draft mode) before resampling.
     
     Args:
-        base64_string (str): Base64-encoded image string
+        img_bytes (bytes): Encoded image
         max_size (int): Maximum width or height in pixels (default: 500)
+        fast (bool): Use draft decoding (default: RESIZE_FAST)
+        resample (str or Image.Resampling): Resampling filter, or its name (default: RESIZE_FILTER)
+        quality (int): JPEG quality of the resized image (default: RESIZE_QUALITY)
     
     Returns:
-        str: Base64-encoded string of the resized image
+        bytes: JPEG-encoded resized image, or the input image if it is small enough
     """
-    # Remove data URL prefix if present
-    if ',' in base64_string:
-        base64_string = base64_string.split(',')[1]
-    
-    # Decode base64 to image
-    img_bytes = base64.b64decode(base64_string)
     img = Image.open(io.BytesIO(img_bytes))
     
     # Get original dimensions
     original_width, original_height = img.size
-    print(f"Original size: {original_width}x{original_height}")
+    if VERBOSE:
+        print(f"Original size: {original_width}x{original_height}")
+
+    if original_width <= max_size and original_height <= max_size:
+        # Nothing to resize: avoid decoding and recompressing the image
+        return img_bytes
     
+    if fast:
+        # Scale the DCT decoding down to the target size; resampling then starts from a small image
+        img.draft('RGB', (max_size, max_size))
+        reducing_gap = None
+    else:
+        # Pillow's default: draft decoding to at least twice the target size
+        reducing_gap = 2.0
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+
     # Calculate new dimensions preserving aspect ratio
-    img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    img.thumbnail((max_size, max_size), resampling_filter(resample), reducing_gap=reducing_gap)
     new_width, new_height = img.size
-    print(f"Resized to: {new_width}x{new_height}")
+    if VERBOSE:
+        print(f"Resized to: {new_width}x{new_height}")
     
-    # Convert back to base64
+    # Encode as JPEG
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def letterbox_image_bytes(img_bytes, size=LETTERBOX_SIZE, fmt=LETTERBOX_FORMAT, fast=FAST, resample=FILTER):
+    """
+    Scale an encoded image to fit within size x size and pad it to a square,
+    as the detector does with its input (so that it does not resample it again).
+
+    Args:
+        img_bytes (bytes): Encoded image
+        size (int): Side of the frame (default: RESIZE_LETTERBOX_SIZE)
+        fmt (str): "png" or "raw" (RGB pixels, row by row) (default: RESIZE_LETTERBOX_FORMAT)
+        fast (bool): Use draft decoding (default: RESIZE_FAST)
+        resample (str or Image.Resampling): Resampling filter, or its name (default: RESIZE_FILTER)
+
+    Returns:
+        tuple: (frame bytes, scale factor, (left, top) padding in pixels)
+    """
+    img = Image.open(io.BytesIO(img_bytes))
+    width, height = img.size
+    scale = min(size / width, size / height)
+    new_width, new_height = round(width * scale), round(height * scale)
+
+    if fast:
+        img.draft('RGB', (new_width, new_height))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if img.size != (new_width, new_height):
+        img = img.resize((new_width, new_height), resampling_filter(resample))
+
+    # Same padding as the detector: centered, gray
+    left = round((size - new_width) / 2 - 0.1)
+    top = round((size - new_height) / 2 - 0.1)
+    frame = Image.new('RGB', (size, size), (114, 114, 114))
+    frame.paste(img, (left, top))
+    if VERBOSE:
+        print(f"Letterboxed {width}x{height} to {size}x{size} (scale: {scale:.4f}, pad: {left},{top})")
+
+    if fmt == "raw":
+        return frame.tobytes(), scale, (left, top)
     buffer = io.BytesIO()
-    img.save(buffer, format='JPEG', quality=95)
-    img_bytes = buffer.getvalue()
-    resized_base64 = base64.b64encode(img_bytes).decode('utf-8')
+    frame.save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue(), scale, (left, top)
+
+
+def image_ext(img_bytes):
+    """Extension of the key of an encoded image, from its format (e.g., "jpg", "png", "webp")"""
+    fmt = Image.open(io.BytesIO(img_bytes)).format
+    if fmt in (None, "JPEG", "MPO"):
+        return "jpg"
+    return fmt.lower() if fmt.lower() in imgref.CONTENT_TYPES else "bin"
+
+
+def resize_base64_image(base64_string, max_size=500):
+    """
+    Resize a base64-encoded image to fit within max_size x max_size while preserving aspect ratio.
     
-    return resized_base64
+    Args:
+        base64_string (str): Base64-encoded image string
+        max_size (int): Maximum width or height in pixels (default: 500)
+    
+    Returns:
+        str: Base64-encoded string of the resized image
+    """
+    # Remove data URL prefix if present
+    if ',' in base64_string:
+        base64_string = base64_string.split(',')[1]
+    
+    img_bytes = resize_image_bytes(base64.b64decode(base64_string), max_size)
+    return base64.b64encode(img_bytes).decode('utf-8')
 
 
 def handler (params, context):
-    if not "img" in params:
+    if "img_key" in params:
+        img_bytes = imgref.get_image(params["img_key"], params.get("img_hash"))
+    elif "img" in params and isinstance(params["img"], str):
+        img = params["img"]
+        # Remove data URL prefix if present
+        if ',' in img:
+            img = img.split(',')[1]
+        with metrics.timed("base64_decode"):
+            img_bytes = base64.b64decode(img)
+    elif "img" in params:
+        # Raw image (binary body)
+        img_bytes = params["img"]
+    else:
         return {}
-    img = params["img"]
+
+    if MODE == "letterbox":
+        return letterbox_handler(params, img_bytes)
+
+    resized = resize_image_bytes(img_bytes)
 
     response = {}
-    response["img"] = resize_base64_image(img)
+    if BY_REF:
+        # Small images are passed on untouched, in their original format
+        ext = "jpg" if resized is not img_bytes else image_ext(img_bytes)
+        response["img_key"], response["img_hash"] = imgref.put_image(resized, ext=ext)
+    else:
+        with metrics.timed("base64_encode"):
+            response["img"] = base64.b64encode(resized).decode('utf-8')
+
+    return response
+
+
+def letterbox_handler(params, img_bytes):
+    """
+    Return the letterboxed frame for the detector, its geometry, and the
+    original image (passed on untouched, for the crops).
+    """
+    frame, scale, (pad_x, pad_y) = letterbox_image_bytes(img_bytes)
+
+    response = {"frame_size": LETTERBOX_SIZE, "frame_format": LETTERBOX_FORMAT,
+                "scale": scale, "pad_x": pad_x, "pad_y": pad_y}
+    if BY_REF:
+        response["img_key"], response["img_hash"] = imgref.put_image(frame, ext=LETTERBOX_FORMAT)
+        # Stored even if it was passed by reference: later stages delete it, so it must be a frame of this workflow
+        response["orig_key"], response["orig_hash"] = imgref.put_image(img_bytes, ext=image_ext(img_bytes))
+    else:
+        with metrics.timed("base64_encode"):
+            response["img"] = base64.b64encode(frame).decode('utf-8')
+            if isinstance(params.get("img"), str):
+                response["orig"] = params["img"]
+            else:
+                response["orig"] = base64.b64encode(img_bytes).decode('utf-8')
 
     return response
 
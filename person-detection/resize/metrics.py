@@ -0,0 +1,106 @@
+import bisect
+import contextlib
+import threading
+import time
+
+# Upper bounds (in seconds) of the histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Histogram with fixed buckets; observing a value only increments counters"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum
+
+
+# Histograms of the invocation phases, created on first use
+_histograms = {}
+_histograms_lock = threading.Lock()
+# Timings of the invocation handled by the current thread
+_current = threading.local()
+
+
+def histogram(phase):
+    h = _histograms.get(phase)
+    if h is None:
+        with _histograms_lock:
+            h = _histograms.setdefault(phase, Histogram())
+    return h
+
+
+def begin(enabled=True):
+    """Start collecting the timings of the invocation handled by this thread (only if they are returned)"""
+    _current.timings = {} if enabled else None
+
+
+def end():
+    """Stop collecting, and return the timings of the invocation handled by this thread"""
+    timings = getattr(_current, "timings", None)
+    _current.timings = None
+    return timings
+
+
+def record(phase, seconds):
+    """Add the duration of a phase to its histogram and to the timings of the current invocation"""
+    histogram(phase).observe(seconds)
+    add(phase, seconds)
+
+
+def add(phase, seconds):
+    """Add the duration of a phase to the timings of the current invocation, if they are collected"""
+    timings = getattr(_current, "timings", None)
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + seconds
+
+
+@contextlib.contextmanager
+def timed(phase):
+    """Record the duration of the enclosed code as a phase (e.g., in handlers)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start)
+
+
+def render(server_stats=None):
+    """Histograms (and server counters) in the Prometheus text format"""
+    lines = ["# HELP executor_phase_seconds Time spent in each phase of the invocations",
+             "# TYPE executor_phase_seconds histogram"]
+    with _histograms_lock:
+        histograms = sorted(_histograms.items())
+    for phase, h in histograms:
+        counts, total = h.snapshot()
+        cumulative = 0
+        for bound, count in zip(h.buckets, counts):
+            cumulative += count
+            lines.append(f'executor_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'executor_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} {cumulative}')
+        lines.append(f'executor_phase_seconds_sum{{phase="{phase}"}} {total}')
+        lines.append(f'executor_phase_seconds_count{{phase="{phase}"}} {cumulative}')
+
+    if server_stats is not None:
+        lines += ["# HELP executor_invocations_total Invocations served and rejected",
+                  "# TYPE executor_invocations_total counter",
+                  f'executor_invocations_total{{result="served"}} {server_stats["Served"]}',
+                  f'executor_invocations_total{{result="rejected"}} {server_stats["Rejected"]}',
+                  "# HELP executor_invocations Invocations running and queued",
+                  "# TYPE executor_invocations gauge",
+                  f'executor_invocations{{state="running"}} {server_stats["Running"]}',
+                  f'executor_invocations{{state="queued"}} {server_stats["Queued"]}']
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,159 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from minio import Minio
+
+# Read config from environment
+MINIO_ENDPOINT   = os.getenv("MINIO_ENDPOINT", "localhost:9000")
+MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "minio")
+MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "minio123")
+MINIO_BUCKET     = os.getenv("MINIO_BUCKET", "serverledge")
+MINIO_SECURE     = os.getenv("MINIO_SECURE", "false").lower() == "true"
+# Part size for multipart uploads and ranged downloads (min. 5 MiB)
+MINIO_PART_SIZE   = int(os.getenv("MINIO_PART_SIZE", str(16 * 1024 * 1024)))
+# Number of parts transferred concurrently
+MINIO_CONCURRENCY = int(os.getenv("MINIO_CONCURRENCY", "4"))
+# Size of the buffers used to write downloaded data
+BUFFER_SIZE = 1024 * 1024
+
+# Initialize client
+client = Minio(
+    MINIO_ENDPOINT,
+    access_key=MINIO_ACCESS_KEY,
+    secret_key=MINIO_SECRET_KEY,
+    secure=MINIO_SECURE
+)
+
+# Buckets known to exist, so that they are checked once per process
+_confirmed_buckets = set()
+_stats_lock = threading.Lock()
+# Round trips to MinIO avoided so far
+stats = {"bucket_checks_skipped": 0, "stat_calls_skipped": 0}
+
+def _count(name):
+    with _stats_lock:
+        stats[name] += 1
+
+def get_stats():
+    """Return the number of round trips to MinIO avoided so far"""
+    with _stats_lock:
+        return dict(stats)
+
+def ensure_bucket(bucket_name=MINIO_BUCKET):
+    """Create bucket if it does not exist"""
+    if bucket_name in _confirmed_buckets:
+        _count("bucket_checks_skipped")
+        return
+    if not client.bucket_exists(bucket_name):
+        client.make_bucket(bucket_name)
+        print(f"Created bucket: {bucket_name}")
+    else:
+        print(f"Bucket {bucket_name} already exists")
+    _confirmed_buckets.add(bucket_name)
+
+def stat(object_name, bucket_name=MINIO_BUCKET):
+    """Return the object info, or None if the object does not exist"""
+    try:
+        return client.stat_object(bucket_name, object_name)
+    except:
+        return None
+
+def exists(object_name, bucket_name=MINIO_BUCKET):
+    return stat(object_name, bucket_name) is not None
+     
+def _can_upload(object_name, bucket_name, override):
+    """Check whether an upload may proceed; the stat is skipped when overriding"""
+    if override:
+        _count("stat_calls_skipped")
+        return True
+    if exists(object_name, bucket_name):
+        print(f"! Upload canceled. Object {bucket_name}/{object_name} already exists.")
+        return False
+    return True
+
+def upload_file(local_path, object_name, bucket_name=MINIO_BUCKET, override=False):
+    """Upload local file to MinIO. Returns False if the object exists and override is not set"""
+    ensure_bucket(bucket_name)
+    if not _can_upload(object_name, bucket_name, override):
+        return False
+    client.fput_object(bucket_name, object_name, local_path, part_size=MINIO_PART_SIZE,
+                       num_parallel_uploads=MINIO_CONCURRENCY)
+    return True
+    # print(f"Uploaded {local_path} → {bucket_name}/{object_name}")
+
+def upload_bytes(data, object_name, bucket_name=MINIO_BUCKET, override=False, content_type="application/octet-stream"):
+    """Upload an in-memory buffer to MinIO. Returns False if the object exists and override is not set"""
+    ensure_bucket(bucket_name)
+    if not _can_upload(object_name, bucket_name, override):
+        return False
+    client.put_object(bucket_name, object_name, io.BytesIO(data), len(data), content_type=content_type)
+    return True
+
+def upload_stream(stream, object_name, bucket_name=MINIO_BUCKET, override=False, content_type="application/octet-stream"):
+    """Upload a readable stream of unknown length to MinIO (as a multipart upload)"""
+    ensure_bucket(bucket_name)
+    if not _can_upload(object_name, bucket_name, override):
+        return False
+    client.put_object(bucket_name, object_name, stream, -1, part_size=MINIO_PART_SIZE, content_type=content_type)
+    return True
+
+def remove(object_name, bucket_name=MINIO_BUCKET):
+    """Delete an object (deleting a missing object is not an error)"""
+    client.remove_object(bucket_name, object_name)
+
+def download_bytes(object_name, bucket_name=MINIO_BUCKET):
+    """Download an object from MinIO into memory"""
+    response = client.get_object(bucket_name, object_name)
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+def _download_part(object_name, local_path, bucket_name, offset, length, etag):
+    """Download a byte range of an object into the same range of local_path"""
+    response = client.get_object(bucket_name, object_name, offset=offset, length=length,
+                                 request_headers={"If-Match": f'"{etag}"'})
+    try:
+        with open(local_path, "r+b") as f:
+            f.seek(offset)
+            for chunk in response.stream(BUFFER_SIZE):
+                f.write(chunk)
+    finally:
+        response.close()
+        response.release_conn()
+
+def _download_ranges(object_name, local_path, bucket_name, size, etag):
+    """Download an object as MINIO_PART_SIZE ranges, MINIO_CONCURRENCY at a time"""
+    tmp_path = f"{local_path}.part"
+    with open(tmp_path, "wb") as f:
+        f.truncate(size)
+    with ThreadPoolExecutor(max_workers=MINIO_CONCURRENCY) as pool:
+        parts = [pool.submit(_download_part, object_name, tmp_path, bucket_name, offset,
+                             min(MINIO_PART_SIZE, size - offset), etag)
+                 for offset in range(0, size, MINIO_PART_SIZE)]
+        for part in parts:
+            part.result()
+    os.replace(tmp_path, local_path)
+
+def download_file(object_name, local_path, bucket_name=MINIO_BUCKET):
+    """Download file from MinIO. Large objects are downloaded as concurrent byte ranges"""
+    try:
+        st = client.stat_object(bucket_name, object_name)
+        if MINIO_CONCURRENCY > 1 and st.size > MINIO_PART_SIZE:
+            _download_ranges(object_name, local_path, bucket_name, st.size, st.etag)
+        else:
+            client.fget_object(bucket_name, object_name, local_path)
+        # print(f"Downloaded {bucket_name}/{object_name} → {local_path}")
+    except Exception as e:
+        print(f"Error while downloading file from MinIO: {str(e)}")
+        return False
+    return True
+
+# Save a dataset
+# upload_file("test_sample.csv", "raw/test_sample.csv")
+
+# Retrieve it later
+# ret = download_file("raw/test_sample.csv", "restored_test_sample.csv")
+# print(f"Downloaded? {ret}")
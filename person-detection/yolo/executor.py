@@ -1,48 +1,292 @@
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import startup
+import metrics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import time
 import os
 import sys
 import importlib
 import json
-import function
+import threading
+from email.parser import BytesParser
+from email import policy
+from urllib.parse import urlsplit, parse_qsl
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 hostName = "0.0.0.0"
 serverPort = 8080
 
-from io import StringIO
-import sys
+# Max. number of requests handled at the same time (0: unlimited)
+MAX_CONCURRENCY = int(os.getenv("EXECUTOR_CONCURRENCY", "1"))
+# Max. number of requests waiting for a free slot before rejecting new ones (-1: unlimited)
+MAX_QUEUE = int(os.getenv("EXECUTOR_QUEUE", "-1"))
+# Import the function in background as soon as the server is listening (otherwise, at the first request)
+PRELOAD = os.getenv("EXECUTOR_PRELOAD", "true").lower() == "true"
+# Add the duration of each phase to every response (otherwise, only when requested with "ReturnTimings")
+RETURN_TIMINGS = os.getenv("EXECUTOR_TIMINGS", "false").lower() == "true"
+# Embed the result in the response as a JSON value instead of a JSON-encoded string (otherwise, only when requested
+# with "RawResult"). Serverledge expects a string, so only direct clients should enable it
+RAW_RESULT = os.getenv("EXECUTOR_RAW_RESULT", "false").lower() == "true"
+# Parameter receiving the body of application/octet-stream invocations (can be changed with ?param=...)
+BINARY_PARAM = os.getenv("EXECUTOR_BINARY_PARAM", "img")
 
-class CaptureOutput:
-    def __enter__(self):
-        self._stdout_output = ''
-        self._stderr_output = ''
+def json_loads(data):
+    """Decode JSON from bytes-like objects without copying them (with orjson, if available)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj):
+    """Encode to JSON bytes (with orjson, if available)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            pass
+    return json.dumps(obj).encode("utf-8")
+
+def read_body(rfile, length):
+    """Read the request body into a single preallocated buffer"""
+    body = bytearray(length)
+    view = memoryview(body)
+    pos = 0
+    while pos < length:
+        n = rfile.readinto(view[pos:])
+        if not n:
+            break
+        pos += n
+    view.release()
+    if pos < length:
+        del body[pos:]
+    return body
+
+def flag(value):
+    if isinstance(value, str):
+        return value.lower() in ("true", "1", "yes")
+    return bool(value)
+
+def parse_request(path, content_type, body):
+    """
+    Build the invocation request from the body.
+
+    JSON bodies contain the request. The body of application/octet-stream
+    requests is passed as raw bytes in the parameter BINARY_PARAM, the other
+    parameters and flags are taken from the query string. Each part of a
+    multipart/form-data body is a parameter (as bytes), except a "request"
+    part that contains the JSON request.
+    """
+    content_type = content_type or "application/json"
+    if content_type.startswith("application/octet-stream"):
+        query = dict(parse_qsl(urlsplit(path).query))
+        request = {flag_name: query.pop(flag_name) for flag_name in ("ReturnOutput", "ReturnTimings", "RawResult")
+                   if flag_name in query}
+        params = query
+        params[params.pop("param", BINARY_PARAM)] = body
+        request["Params"] = params
+        return request
+
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=policy.HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+        request = {}
+        params = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            data = part.get_payload(decode=True)
+            if name == "request":
+                request = json_loads(data)
+            else:
+                params[name] = data
+        request.setdefault("Params", {}).update(params)
+        return request
+
+    return json_loads(body)
+
+_function = None
+_function_lock = threading.Lock()
+
+def get_function():
+    """Import the function module once; its (possibly heavy) imports do not delay the server startup"""
+    global _function
+    if _function is None:
+        with _function_lock:
+            if _function is None:
+                with startup.phase("import_function"):
+                    _function = importlib.import_module("function")
+                startup.mark("function_ready")
+    return _function
+
+# Output of the handlers: "info" prints it, "quiet" discards it (unless it is returned with ReturnOutput)
+LOG_LEVEL = os.getenv("EXECUTOR_LOG_LEVEL", "info").lower()
+# Max. characters of stdout (and of stderr) returned per invocation
+MAX_OUTPUT = int(os.getenv("EXECUTOR_MAX_OUTPUT", str(64 * 1024)))
+
+# Output capture of the invocation handled by the current thread
+_output = threading.local()
+
+class _Capture:
+    """Output of an invocation, bounded to MAX_OUTPUT characters per stream"""
+
+    def __init__(self, limit=MAX_OUTPUT):
+        self.limit = limit
+        self.parts = {"stdout": [], "stderr": []}
+        self.sizes = {"stdout": 0, "stderr": 0}
+        self.dropped = {"stdout": 0, "stderr": 0}
+
+    def write(self, stream, text):
+        room = self.limit - self.sizes[stream]
+        if room > 0:
+            self.parts[stream].append(text[:room])
+            self.sizes[stream] += min(room, len(text))
+        self.dropped[stream] += max(0, len(text) - max(room, 0))
+        return len(text)
+
+    def getvalue(self, stream):
+        value = "".join(self.parts[stream])
+        if self.dropped[stream]:
+            value += f"\n... [{self.dropped[stream]} characters truncated]"
+        return value
+
+class _Discard:
+    def write(self, stream, text):
+        return len(text)
+
+class OutputRouter:
+    """
+    Replaces sys.stdout/sys.stderr: writes go to the capture of the invocation
+    handled by the current thread, if any, and to the original stream otherwise.
+    """
+
+    def __init__(self, stream, name):
+        self.stream = stream
+        self.name = name
+
+    def write(self, text):
+        capture = getattr(_output, "capture", None)
+        if capture is None:
+            return self.stream.write(text)
+        return capture.write(self.name, text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+sys.stdout = OutputRouter(sys.stdout, "stdout")
+sys.stderr = OutputRouter(sys.stderr, "stderr")
 
-        self._stdout = sys.stdout
-        sys.stdout = StringIO()
+class CaptureOutput:
+    """Capture the output of the current thread (other invocations are not affected)"""
 
-        self._stderr = sys.stderr
-        sys.stderr = StringIO()
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._capture = None
 
+    def __enter__(self):
+        if self.enabled:
+            self._capture = _Capture()
+        elif LOG_LEVEL == "quiet":
+            self._capture = _Discard()
+        _output.capture = self._capture
         return self
 
     def __exit__(self, *args):
-        self._stdout_output = sys.stdout.getvalue()
-        sys.stdout = self._stdout
-
-        self._stderr_output = sys.stderr.getvalue()
-        sys.stderr = self._stderr
+        _output.capture = None
 
     def get_stdout(self):
-        return self._stdout_output
+        return self._capture.getvalue("stdout") if self.enabled else ""
 
     def get_stderr(self):
-        return self._stderr_output
+        return self._capture.getvalue("stderr") if self.enabled else ""
+
+class Server(ThreadingHTTPServer):
+    """
+    HTTP server that accepts connections concurrently, but runs at most
+    `concurrency` handlers at the same time. Requests waiting for a slot are
+    queued; once `max_queue` requests are waiting, new ones are rejected.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, handler_class, concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE):
+        super().__init__(address, handler_class)
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.slots = threading.BoundedSemaphore(concurrency) if concurrency > 0 else None
+        self.stats_lock = threading.Lock()
+        self.running = 0
+        self.queued = 0
+        self.rejected = 0
+        self.served = 0
+
+    def acquire(self):
+        """Wait for a free handler slot. Returns False if the request is rejected."""
+        if self.slots is not None and not self.slots.acquire(blocking=False):
+            with self.stats_lock:
+                if 0 <= self.max_queue <= self.queued:
+                    self.rejected += 1
+                    return False
+                self.queued += 1
+            self.slots.acquire()
+            with self.stats_lock:
+                self.queued -= 1
+        with self.stats_lock:
+            self.running += 1
+        return True
+
+    def release(self):
+        with self.stats_lock:
+            self.running -= 1
+            self.served += 1
+        if self.slots is not None:
+            self.slots.release()
+
+    def stats(self):
+        with self.stats_lock:
+            return {"Concurrency": self.concurrency, "MaxQueue": self.max_queue,
+                    "Running": self.running, "Queued": self.queued,
+                    "Rejected": self.rejected, "Served": self.served}
 
 class Executor(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if "metrics" in self.path:
+            self.send_response(200)
+            self.send_header("Content-type", "text/plain; version=0.0.4")
+            self.end_headers()
+            self.wfile.write(metrics.render(self.server.stats()).encode("utf-8"))
+            return
+
+        if "startup" in self.path:
+            status = startup.report()
+        elif "status" in self.path:
+            status = self.server.stats()
+            if _function is not None and hasattr(_function, "get_stats"):
+                status["Function"] = _function.get_stats()
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(bytes(json.dumps(status), "utf-8"))
+
     def do_POST(self):
+        startup.mark("first_request")
+        start = time.perf_counter()
         content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        request = json.loads(post_data.decode('utf-8'))
+        post_data = read_body(self.rfile, content_length)
+        read_seconds = time.perf_counter() - start
+        metrics.record("read", read_seconds)
+
+        start = time.perf_counter()
+        request = parse_request(self.path, self.headers['Content-Type'], post_data)
+        decode_seconds = time.perf_counter() - start
+        metrics.record("json_decode", decode_seconds)
 
         if not "invoke" in self.path:
             self.send_response(404)
@@ -59,34 +303,68 @@ class Executor(BaseHTTPRequestHandler):
         else:
             context = {}
 
-        return_output = bool(request["ReturnOutput"])
+        return_output = flag(request.get("ReturnOutput", False))
+        return_timings = RETURN_TIMINGS or flag(request.get("ReturnTimings", False))
+        raw_result = RAW_RESULT or flag(request.get("RawResult", False))
+
+        start = time.perf_counter()
+        if not self.server.acquire():
+            self.send_response(503)
+            self.end_headers()
+            return
+        queue_seconds = time.perf_counter() - start
+        metrics.record("queue", queue_seconds)
+
+        # Phases of this invocation are collected only if they are returned
+        metrics.begin(return_timings)
+        if return_timings:
+            metrics.add("read", read_seconds)
+            metrics.add("json_decode", decode_seconds)
+            metrics.add("queue", queue_seconds)
 
         response = {}
 
         try:
-            if not return_output:
+            function = get_function()
+            start = time.perf_counter()
+            with CaptureOutput(enabled=return_output) as capturer:
                 result = function.handler(params, context)
-                response["Output"] = ""
-            else:
-                with CaptureOutput() as capturer:
-                    result = function.handler(params, context)
-                response["Output"] = str(capturer.get_stdout()) + "\n" + str(capturer.get_stderr())
+            response["Output"] = capturer.get_stdout() + "\n" + capturer.get_stderr() if return_output else ""
+            metrics.record("handler", time.perf_counter() - start)
 
-            response["Result"] = json.dumps(result)
+            start = time.perf_counter()
+            # The result is encoded once with the response, unless it must be sent as a string
+            response["Result"] = result if raw_result else json_dumps(result).decode("utf-8")
+            metrics.record("json_encode", time.perf_counter() - start)
             response["Success"] = True
         except Exception as e:
             print(e, file=sys.stderr)
             response["Success"] = False
+        finally:
+            self.server.release()
+            timings = metrics.end()
+
+        if return_timings:
+            response["Timings"] = timings
+
+        start = time.perf_counter()
+        body = json_dumps(response)
+        metrics.record("response_encode", time.perf_counter() - start)
 
         self.send_response(200)
         self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        self.wfile.write(bytes(json.dumps(response), "utf-8"))
+        self.wfile.write(body)
+        startup.mark("first_response")
 
 
 
 if __name__ == "__main__":        
-    srv = HTTPServer((hostName, serverPort), Executor)
+    srv = Server((hostName, serverPort), Executor)
+    startup.mark("listening")
+    if PRELOAD:
+        threading.Thread(target=get_function, daemon=True).start()
     try:
         srv.serve_forever()
     except KeyboardInterrupt:
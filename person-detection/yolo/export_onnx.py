@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+""" Export YOLO weights to ONNX for the "onnx" backend, optionally quantized to INT8.
+
+Usage: python3 export_onnx.py [yolov8n.pt] [--imgsz 640] [--int8 [CALIBRATION_DIR]]
+
+Requires ultralytics (for the export) and onnxruntime (for the quantization).
+The model is written next to the weights (e.g., yolov8n.onnx); the INT8 model
+is written as yolov8n-int8.onnx. With a directory of calibration images
+(frames similar to the ones seen in production), activations are quantized
+statically; otherwise only the weights are quantized (dynamic quantization).
+Check the accuracy of the result with parity_check.py.
+"""
+import argparse
+import glob
+import os
+
+from PIL import Image
+
+import onnx_backend
+
+
+class CalibrationReader:
+    """Feeds the calibration images to the quantizer, preprocessed as at inference time"""
+
+    def __init__(self, model_path, image_dir, imgsz):
+        import onnxruntime as ort
+        self.input_name = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+        self.files = iter(sorted(f for f in glob.glob(os.path.join(image_dir, "*"))
+                                 if f.lower().endswith((".jpg", ".jpeg", ".png"))))
+        self.imgsz = imgsz
+
+    def get_next(self):
+        path = next(self.files, None)
+        if path is None:
+            return None
+        arr, _, _ = onnx_backend.letterbox(Image.open(path).convert('RGB'), self.imgsz)
+        return {self.input_name: onnx_backend.to_tensor([arr])}
+
+
+def export(weights, imgsz):
+    from ultralytics import YOLO
+    # Dynamic shapes let the executor run micro-batches of any size
+    return YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+
+
+def quantize(model_path, calibration_dir=None, imgsz=640):
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    base, ext = os.path.splitext(model_path)
+    prepared = f"{base}-prep{ext}"
+    output = f"{base}-int8{ext}"
+    quant_pre_process(model_path, prepared)
+    try:
+        if calibration_dir:
+            quantize_static(prepared, output, CalibrationReader(prepared, calibration_dir, imgsz),
+                            quant_format=QuantFormat.QDQ, per_channel=True,
+                            activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+        else:
+            quantize_dynamic(prepared, output, weight_type=QuantType.QUInt8)
+    finally:
+        os.remove(prepared)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export YOLO weights to ONNX")
+    parser.add_argument("weights", nargs="?", default="yolov8n.pt")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--int8", nargs="?", const="", default=None, metavar="CALIBRATION_DIR",
+                        help="also write an INT8 model (statically quantized if calibration images are given)")
+    args = parser.parse_args()
+
+    model_path = export(args.weights, args.imgsz)
+    print(f"> Exported {model_path} ({os.path.getsize(model_path) / 2**20:.1f} MiB)")
+    if args.int8 is not None:
+        int8_path = quantize(model_path, args.int8, args.imgsz)
+        print(f"> Quantized {int8_path} ({os.path.getsize(int8_path) / 2**20:.1f} MiB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from PIL import Image
+
+
+def digest(img_bytes, raw_size=None):
+    """Exact key of a frame: hash of its encoded content (and of the side of raw frames)"""
+    h = hashlib.blake2b(img_bytes, digest_size=16)
+    h.update(str(raw_size).encode())
+    return h.digest()
+
+
+def geometry(img, raw_size=None):
+    """Size and format of a decoded frame: detections are only valid for frames with the same geometry"""
+    return img.size, raw_size, img.format
+
+
+def dhash(img, size=8):
+    """
+    Difference hash of an image: each bit tells whether a pixel of a
+    (size + 1) x size grayscale thumbnail is darker than its right neighbour.
+    Near-identical frames (e.g., from a fixed camera) have close hashes.
+
+    Args:
+        img (PIL.Image): Decoded image
+        size (int): Side of the hash, in bits (default: 8, i.e., a 64-bit hash)
+
+    Returns:
+        int: Hash
+    """
+    thumb = img.resize((size + 1, size), Image.Resampling.BOX, reducing_gap=2.0).convert('L')
+    pixels = thumb.tobytes()
+    bits = 0
+    for row in range(size):
+        for col in range(row * (size + 1), row * (size + 1) + size):
+            bits = (bits << 1) | (pixels[col] < pixels[col + 1])
+    return bits
+
+
+class FrameCache:
+    """
+    Detections of recent frames, looked up by exact content first, and then
+    by the Hamming distance of their dHash (at most `max_distance` bits,
+    -1: exact matches only) among frames with the same geometry, since the
+    dHash does not depend on the resolution or encoding of a frame. Holds up to `max_entries` frames, evicting the
+    least recently used; entries expire `ttl` seconds after being added, so
+    that a static scene is analyzed again from time to time.
+    """
+
+    def __init__(self, max_entries, ttl, max_distance):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        # Digest -> (dHash, geometry, time added, detections)
+        self.entries = OrderedDict()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # Inference time of the misses, to estimate the time saved by hits
+        self.miss_seconds = 0.0
+
+    def _expired(self, key, added, now):
+        if now - added <= self.ttl:
+            return False
+        del self.entries[key]
+        self.expirations += 1
+        return True
+
+    def get(self, key):
+        """Detections of a frame with the same content, or None"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or self._expired(key, entry[2], now):
+                return None
+            self.entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry[3]
+
+    def get_similar(self, phash, frame_geometry):
+        """Detections of the frame with the same geometry and the closest dHash within max_distance, or None"""
+        now = time.monotonic()
+        with self.lock:
+            best_key, best_distance = None, self.max_distance + 1
+            for key, (other, other_geometry, added, _) in list(self.entries.items()):
+                if self._expired(key, added, now) or other_geometry != frame_geometry:
+                    continue
+                distance = (phash ^ other).bit_count()
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+            if best_key is None:
+                return None
+            self.entries.move_to_end(best_key)
+            self.similar_hits += 1
+            return self.entries[best_key][3]
+
+    def put(self, key, phash, frame_geometry, detections, seconds):
+        """Add the detections of a frame not found in the cache, which took `seconds` to compute"""
+        with self.lock:
+            self.misses += 1
+            self.miss_seconds += seconds
+            self.entries[key] = (phash, frame_geometry, time.monotonic(), detections)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_stats(self):
+        with self.lock:
+            hits = self.exact_hits + self.similar_hits
+            avg_miss = self.miss_seconds / self.misses if self.misses else 0.0
+            return {"Entries": len(self.entries), "ExactHits": self.exact_hits, "SimilarHits": self.similar_hits,
+                    "Misses": self.misses, "HitRatio": hits / (hits + self.misses) if hits + self.misses else 0.0,
+                    "Evictions": self.evictions, "Expirations": self.expirations,
+                    "SavedSeconds": hits * avg_miss}
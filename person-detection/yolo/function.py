@@ -1,85 +1,397 @@
 # pip install ultralytics pillow numpy
 import base64
 import io
+import itertools
+import os
+import threading
+import time
 from PIL import Image
 import numpy as np
-from ultralytics import YOLO
+import frame_cache
+import imgref
+import metrics
+import startup
+import video
 
+# Inference backend: "torch" (ultralytics) or "onnx" (ONNX Runtime, with a model exported by export_onnx.py)
+BACKEND        = os.getenv("YOLO_BACKEND", "torch").lower()
+MODEL_PATH     = os.getenv("YOLO_MODEL", "yolov8n.onnx" if BACKEND == "onnx" else "yolov8n.pt")
+CONF_THRESHOLD = float(os.getenv("YOLO_CONF", "0.25"))
+IOU_THRESHOLD  = float(os.getenv("YOLO_IOU", "0.7"))
+WARMUP         = os.getenv("YOLO_WARMUP", "true").lower() == "true"
+# Time window for grouping concurrent invocations into one batch (0: disabled)
+BATCH_WINDOW_MS = float(os.getenv("YOLO_BATCH_WINDOW_MS", "0"))
+MAX_BATCH       = int(os.getenv("YOLO_MAX_BATCH", "8"))
+# Reuse the detections of recent identical frames (0: disabled), for up to YOLO_CACHE_TTL seconds
+CACHE_SIZE     = int(os.getenv("YOLO_CACHE_SIZE", "256"))
+CACHE_TTL      = float(os.getenv("YOLO_CACHE_TTL", "10"))
+# Also reuse them for near-identical frames, whose dHash differs by at most this many bits (-1: disabled)
+CACHE_DISTANCE = int(os.getenv("YOLO_CACHE_DISTANCE", "-1"))
+# Video input: sample every Nth frame, or N frames per second if VIDEO_FPS > 0, up to VIDEO_MAX_FRAMES (0: all)
+VIDEO_EVERY      = int(os.getenv("VIDEO_EVERY", "1"))
+VIDEO_FPS        = float(os.getenv("VIDEO_FPS", "0"))
+VIDEO_MAX_FRAMES = int(os.getenv("VIDEO_MAX_FRAMES", "0"))
+# Frames are downscaled to fit VIDEO_MAX_SIZE (the input size of the model) and detected VIDEO_BATCH at a time
+VIDEO_MAX_SIZE   = int(os.getenv("VIDEO_MAX_SIZE", "640"))
+VIDEO_BATCH      = int(os.getenv("VIDEO_BATCH", "8"))
+# Print each detected box (disabled when the executor output is "quiet")
+VERBOSE = os.getenv("EXECUTOR_LOG_LEVEL", "info").lower() != "quiet"
 
-def detect_objects_from_base64(base64_string, model=None, model_path='yolov8n.pt', conf_threshold=0.25):
+# Models loaded by this process, keyed by backend and weights path
+_models = {}
+_models_lock = threading.Lock()
+# Models are not safe to call from several threads at once
+_inference_lock = threading.Lock()
+
+
+def get_model(model_path=MODEL_PATH, backend=BACKEND):
     """
-    Detect objects in a base64-encoded image using YOLO.
-    
+    Return the YOLO model for model_path, loading it on first use.
+
+    Models are kept for the lifetime of the process, so warm invocations
+    reuse the already loaded weights.
+    """
+    model = _models.get((backend, model_path))
+    if model is None:
+        with _models_lock:
+            model = _models.get((backend, model_path))
+            if model is None:
+                # The backend (ultralytics and torch, or onnxruntime) is imported with the first model
+                with startup.phase("model_load"):
+                    if backend == "onnx":
+                        from onnx_backend import OnnxDetector
+                        model = OnnxDetector(model_path)
+                    else:
+                        from ultralytics import YOLO
+                        model = YOLO(model_path)
+                _models[(backend, model_path)] = model
+    return model
+
+
+def warmup(model_path=MODEL_PATH, conf_threshold=CONF_THRESHOLD):
+    """Load the model and run one inference on a blank frame."""
+    model = get_model(model_path)
+    blank = Image.new('RGB', (640, 640))
+    with startup.phase("warmup"), _inference_lock:
+        model(blank, conf=conf_threshold, classes=person_class_ids(model), verbose=False)
+
+
+def decode_image_bytes(img_bytes, raw_size=None):
+    """
+    Decode an encoded image into an RGB PIL Image.
+
     Args:
-        base64_string (str): Base64-encoded image string
-        model (YOLO, optional): Pre-loaded YOLO model instance. If None, loads from model_path
-        model_path (str): Path to YOLO model weights (default: yolov8n.pt)
-        conf_threshold (float): Confidence threshold for detections (default: 0.25)
-    
+        img_bytes (bytes): Encoded image, or RGB pixels of a raw_size x raw_size frame
+        raw_size (int, optional): Side of the frame, if img_bytes contains raw pixels
+
     Returns:
-        dict: Dictionary containing:
-            - 'detections': List of detected objects with their properties
-            - 'image': PIL Image object with detection boxes drawn
-            - 'results': Raw YOLO results object
+        PIL.Image: Decoded image
     """
-    # Remove data URL prefix if present (e.g., "data:image/jpeg;base64,")
-    if ',' in base64_string:
-        base64_string = base64_string.split(',')[1]
-    
-    # Decode base64 to image
-    img_bytes = base64.b64decode(base64_string)
+    if raw_size:
+        # Letterboxed frame from resize: no decoding needed
+        return Image.frombuffer('RGB', (raw_size, raw_size), img_bytes, 'raw', 'RGB', 0, 1)
+
     img = Image.open(io.BytesIO(img_bytes))
     
     # Convert to RGB if necessary
     if img.mode != 'RGB':
         img = img.convert('RGB')
+    return img
+
+
+def decode_base64(base64_string):
+    """
+    Decode a base64-encoded image string into the encoded image.
+
+    Args:
+        base64_string (str): Base64-encoded image string, optionally with a data URL prefix
+
+    Returns:
+        bytes: Encoded image
+    """
+    # Remove data URL prefix if present (e.g., "data:image/jpeg;base64,")
+    if ',' in base64_string:
+        base64_string = base64_string.split(',')[1]
     
-    # Load YOLO model (use provided model or load from path)
+    with metrics.timed("base64_decode"):
+        return base64.b64decode(base64_string)
+
+
+def decode_base64_image(base64_string, raw_size=None):
+    """
+    Decode a base64-encoded image into an RGB PIL Image.
+
+    Args:
+        base64_string (str): Base64-encoded image string, optionally with a data URL prefix
+        raw_size (int, optional): Side of the frame, if the string contains raw pixels
+
+    Returns:
+        PIL.Image: Decoded image
+    """
+    return decode_image_bytes(decode_base64(base64_string), raw_size)
+
+
+def person_class_ids(model):
+    """Class IDs named "person" in the model (0 for the COCO models)"""
+    return [class_id for class_id, name in model.names.items() if name.lower() == "person"]
+
+
+def extract_person_boxes(result):
+    """
+    Extract the bounding boxes of people from a YOLO result.
+
+    The inference is restricted to the person class, so all the boxes are
+    kept; they are copied from the device with a single transfer.
+
+    Args:
+        result: YOLO result for a single image, or the (N, 4) array of boxes
+            returned by the ONNX backend
+
+    Returns:
+        list: Bounding boxes as [x1, y1, x2, y2] lists of floats
+    """
+    xyxy = result if isinstance(result, np.ndarray) else result.boxes.xyxy.cpu().numpy()
+
+    if VERBOSE:
+        print(f"People: {len(xyxy)}, Boxes: {xyxy.round(1).tolist()}")
+
+    return xyxy.tolist()
+
+
+def detect_people(imgs, model=None, model_path=MODEL_PATH, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD):
+    """
+    Detect people in a list of images with a single inference call.
+
+    Args:
+        imgs (list): List of PIL Image objects
+        model (YOLO, optional): Pre-loaded YOLO model instance. If None, uses the cached model for model_path
+        model_path (str): Path to YOLO model weights (default: $YOLO_MODEL or yolov8n.pt)
+        conf_threshold (float): Confidence threshold for detections (default: 0.25)
+        iou_threshold (float): IoU threshold of non-maximum suppression (default: 0.7)
+
+    Returns:
+        list: For each image, the list of person bounding boxes
+    """
+    # Use provided model or the cached one for model_path
     if model is None:
-        model = YOLO(model_path)
-    
-    # Run inference
-    results = model(img, conf=conf_threshold)
+        model = get_model(model_path)
+
+    # Run inference on the whole batch; NMS and post-processing only consider people
+    with _inference_lock:
+        results = model(imgs, conf=conf_threshold, iou=iou_threshold, classes=person_class_ids(model))
+
+    return [extract_person_boxes(result) for result in results]
 
-    # Get boxes
-    result = results[0]
-    boxes = result.boxes
-    person_boxes = []
+
+def detect_objects_from_base64(base64_string, model=None, model_path=MODEL_PATH, conf_threshold=CONF_THRESHOLD):
+    """
+    Detect people in a base64-encoded image using YOLO.
     
-    # Iterate through each detection
-    for box in boxes:
-        # Get bounding box coordinates (xyxy format)
-        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-        
-        # Get class ID
-        class_id = int(box.cls[0])
-        
-        # Get class name
-        class_name = result.names[class_id]
-
-        print(f"Class: {class_name}, Box: ({x1}, {y1}, {x2}, {y2})")
-
-        if class_name.lower() == "person":
-            person_boxes.append(f"{x1},{y1},{x2},{y2}")
-    return person_boxes
-        
-    # Get annotated image
-    #annotated_img = results[0].plot()
-    #annotated_img = Image.fromarray(annotated_img)
+    Args:
+        base64_string (str): Base64-encoded image string
+        model (YOLO, optional): Pre-loaded YOLO model instance. If None, uses the cached model for model_path
+        model_path (str): Path to YOLO model weights (default: $YOLO_MODEL or yolov8n.pt)
+        conf_threshold (float): Confidence threshold for detections (default: 0.25)
     
+    Returns:
+        list: Person bounding boxes as [x1, y1, x2, y2] lists of floats
+    """
+    img = decode_base64_image(base64_string)
+    return detect_people([img], model, model_path, conf_threshold)[0]
+
+
+class MicroBatcher:
+    """
+    Groups images submitted by concurrent invocations into a single inference
+    call of at most `max_batch` images. The caller whose image is first in the
+    queue waits up to `window` seconds (or until `max_batch` images are pending)
+    and then runs the batch on behalf of everyone; the first of the images left
+    in the queue leads the next batch.
+    """
+
+    def __init__(self, window, max_batch):
+        self.window = window
+        self.max_batch = max_batch
+        self.cond = threading.Condition()
+        self.pending = []
+
+    def detect(self, img):
+        item = {"img": img, "done": False}
+        with self.cond:
+            self.pending.append(item)
+            if len(self.pending) >= self.max_batch:
+                self.cond.notify_all()
+            self.cond.wait_for(lambda: item["done"] or self.pending and self.pending[0] is item)
+            if item["done"]:
+                batch = None
+            else:
+                self.cond.wait_for(lambda: len(self.pending) >= self.max_batch, timeout=self.window)
+                batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+                # Promote the leader of the next batch
+                self.cond.notify_all()
+
+        if batch:
+            try:
+                results = detect_people([i["img"] for i in batch])
+                for i, boxes in zip(batch, results):
+                    i["result"] = boxes
+            except Exception as e:
+                for i in batch:
+                    i["error"] = e
+            finally:
+                with self.cond:
+                    for i in batch:
+                        i["done"] = True
+                    self.cond.notify_all()
+
+        if "error" in item:
+            raise item["error"]
+        return item["result"]
+
+
+batcher = MicroBatcher(BATCH_WINDOW_MS / 1000, MAX_BATCH) if BATCH_WINDOW_MS > 0 else None
+cache = frame_cache.FrameCache(CACHE_SIZE, CACHE_TTL, CACHE_DISTANCE) if CACHE_SIZE > 0 else None
+
+
+def detect_frames(frames, raw_size=None):
+    """
+    Detect people in encoded frames, reusing the detections of identical (or
+    near-identical) recent frames. The other frames are decoded and run in a
+    single inference call.
+
+    Args:
+        frames (list): Encoded images
+        raw_size (int, optional): Side of the frames, if they contain raw pixels
+
+    Returns:
+        list: For each frame, the list of person bounding boxes
+    """
+    results = [None] * len(frames)
+    misses = []
+    for i, img_bytes in enumerate(frames):
+        key = phash = img_geometry = None
+        if cache is not None:
+            key = frame_cache.digest(img_bytes, raw_size)
+            results[i] = cache.get(key)
+            if results[i] is not None:
+                # Same content: no need to decode it
+                continue
+        img = decode_image_bytes(img_bytes, raw_size)
+        if cache is not None and CACHE_DISTANCE >= 0:
+            phash = frame_cache.dhash(img)
+            img_geometry = frame_cache.geometry(img, raw_size)
+            results[i] = cache.get_similar(phash, img_geometry)
+            if results[i] is not None:
+                continue
+        misses.append((i, img, key, phash, img_geometry))
+
+    if misses:
+        start = time.perf_counter()
+        if batcher is not None and len(misses) == 1:
+            detected = [batcher.detect(misses[0][1])]
+        else:
+            detected = detect_people([img for _, img, _, _, _ in misses])
+        seconds = (time.perf_counter() - start) / len(misses)
+        for (i, _, key, phash, img_geometry), boxes in zip(misses, detected):
+            results[i] = boxes
+            if cache is not None:
+                cache.put(key, phash, img_geometry, boxes, seconds)
+    return results
+
+
+def detect_video(path, every=VIDEO_EVERY, fps=VIDEO_FPS, max_frames=VIDEO_MAX_FRAMES):
+    """
+    Detect people in the sampled frames of a video, decoding and detecting
+    VIDEO_BATCH frames at a time.
+
+    Args:
+        path (str): Path of the video file
+        every (int): Sample every Nth frame (default: VIDEO_EVERY)
+        fps (float): Sample N frames per second of video, if > 0 (default: VIDEO_FPS)
+        max_frames (int): Max. number of sampled frames, 0: all (default: VIDEO_MAX_FRAMES)
+
+    Returns:
+        dict: Columnar result: for each sampled frame, its index, time (seconds) and
+            number of people; the boxes of all the frames, in order, in original
+            frame coordinates
+    """
+    result = {"Frames": [], "Times": [], "Counts": [], "Boxes": []}
+    with video.VideoFrames(path, every, fps, max_frames, VIDEO_MAX_SIZE) as frames:
+        result.update(Width=frames.width, Height=frames.height, FPS=frames.fps)
+        sampled = iter(frames)
+        while True:
+            batch = list(itertools.islice(sampled, VIDEO_BATCH))
+            if not batch:
+                break
+            detections = detect_people([img for _, _, img, _ in batch])
+            for (index, seconds, _, scale), boxes in zip(batch, detections):
+                result["Frames"].append(index)
+                result["Times"].append(round(seconds, 3))
+                result["Counts"].append(len(boxes))
+                result["Boxes"].extend([coord / scale for coord in box] for box in boxes)
+    return result
+
+
+def get_stats():
+    """Frame cache usage (reported by the executor)"""
+    return {"Cache": cache.get_stats() if cache is not None else None}
+
 
 def handler (params, context):
-    if not "img" in params:
-        return {}
-    img = params["img"]
+    if "video_key" in params or "video_path" in params:
+        with video.local_video(params) as path:
+            return detect_video(path, int(params.get("every", VIDEO_EVERY)), float(params.get("fps", VIDEO_FPS)),
+                                int(params.get("max_frames", VIDEO_MAX_FRAMES)))
+
+    if "imgs" in params:
+        results = detect_frames([decode_base64(img) for img in params["imgs"]])
+        return {"Results": [{"Count": len(boxes), "Detections": boxes} for boxes in results]}
 
     response = {}
 
-    person_boxes = detect_objects_from_base64(img)
+    # Frame letterboxed by resize (RESIZE_MODE=letterbox): boxes are relative to the frame, and the
+    # original image is forwarded with the letterbox geometry, so that crop maps them back to it
+    raw_size = params.get("frame_size") if params.get("frame_format") == "raw" else None
+    if "scale" in params:
+        response["Scale"] = params["scale"]
+        response["PadX"] = params["pad_x"]
+        response["PadY"] = params["pad_y"]
+
+    if "img_key" in params:
+        # Image passed by reference: forward only the reference to the next stage
+        key, digest = params["img_key"], params.get("img_hash")
+        img_bytes = imgref.get_image(key, digest)
+        response["ImgKey"] = params.get("orig_key", key)
+        response["ImgHash"] = params.get("orig_hash", digest)
+        # Forwarded (and possibly deleted) keys must be frames of this workflow, too
+        imgref.check_key(response["ImgKey"])
+    elif "img" in params and isinstance(params["img"], str):
+        img_bytes = decode_base64(params["img"])
+        response["Img"] = params.get("orig", params["img"])
+    elif "img" in params:
+        # Raw image (binary body): it is forwarded base64-encoded, since the next stage receives JSON
+        img_bytes = params["img"]
+        with metrics.timed("base64_encode"):
+            response["Img"] = base64.b64encode(params["img"]).decode('utf-8')
+    else:
+        return {}
+
+    person_boxes = detect_frames([img_bytes], raw_size)[0]
     
     response["Count"] = len(person_boxes)
     response["Detections"] = person_boxes
-    response["Img"] = img
+    # Frames are deleted only once detection succeeded, so that a failed invocation can be retried
+    if "ImgKey" in response:
+        if response["ImgKey"] != params["img_key"]:
+            # Letterboxed frame: only needed by this stage
+            imgref.delete_image(params["img_key"])
+        if not person_boxes:
+            # The workflow ends here (crop runs only if people are detected)
+            imgref.delete_image(response["ImgKey"])
 
     return response
 
+
+# Load the weights when the function is imported (by the executor, once it is listening), not on the first request
+if WARMUP:
+    warmup()
@@ -0,0 +1,155 @@
+import ast
+import os
+import numpy as np
+from PIL import Image
+
+# Input size of models exported with dynamic shapes
+INPUT_SIZE = int(os.getenv("YOLO_IMGSZ", "640"))
+# Threads used by ONNX Runtime for each inference (0: one per physical core)
+THREADS = int(os.getenv("YOLO_ORT_THREADS", "0"))
+# Max. detections kept per image (as ultralytics)
+MAX_DET = 300
+# Offset added to the boxes of each class, so that NMS never merges boxes of different classes
+MAX_WH = 7680
+
+
+def letterbox(img, size):
+    """
+    Scale an image to fit within size x size and pad it to a square (as ultralytics).
+
+    Args:
+        img (PIL.Image): RGB image
+        size (int): Side of the model input
+
+    Returns:
+        tuple: HWC uint8 array, scale factor, (left, top) padding
+    """
+    if img.size == (size, size):
+        # Already letterboxed (e.g., by resize)
+        return np.asarray(img), 1.0, (0, 0)
+
+    width, height = img.size
+    scale = min(size / width, size / height)
+    new_width, new_height = round(width * scale), round(height * scale)
+    if (new_width, new_height) != (width, height):
+        img = img.resize((new_width, new_height), Image.Resampling.BILINEAR)
+
+    left = round((size - new_width) / 2 - 0.1)
+    top = round((size - new_height) / 2 - 0.1)
+    canvas = Image.new('RGB', (size, size), (114, 114, 114))
+    canvas.paste(img, (left, top))
+    return np.asarray(canvas), scale, (left, top)
+
+
+def to_tensor(arrays):
+    """Stack HWC uint8 images into a NCHW float32 batch in [0, 1]"""
+    batch = np.stack(arrays).transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+
+def nms(boxes, scores, iou_threshold):
+    """Indices of the boxes kept by non-maximum suppression, by decreasing score"""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+class OnnxDetector:
+    """
+    YOLOv8 detector exported to ONNX (see export_onnx.py), run with ONNX
+    Runtime on the CPU. Pre- and post-processing only need numpy and Pillow,
+    so neither ultralytics nor torch are imported.
+
+    Calling it returns, for each image, the (N, 4) array of xyxy boxes in
+    the coordinates of the original image.
+    """
+
+    def __init__(self, model_path, threads=THREADS):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, _ = model_input.shape
+        # Dimensions are strings when the model was exported with dynamic shapes
+        self.size = height if isinstance(height, int) else INPUT_SIZE
+        self.max_batch = batch if isinstance(batch, int) else None
+
+        # ultralytics stores the class names in the model metadata
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"]) if "names" in metadata else {0: "person"}
+
+    def __call__(self, imgs, conf=0.25, iou=0.7, classes=None, verbose=False):
+        if isinstance(imgs, Image.Image):
+            imgs = [imgs]
+        letterboxed = [letterbox(img, self.size) for img in imgs]
+
+        step = self.max_batch or len(letterboxed)
+        outputs = []
+        for i in range(0, len(letterboxed), step):
+            batch = to_tensor([arr for arr, _, _ in letterboxed[i:i + step]])
+            outputs.extend(self.session.run(None, {self.input_name: batch})[0])
+
+        return [self.postprocess(output, scale, pad, img.size, conf, iou, classes)
+                for output, (_, scale, pad), img in zip(outputs, letterboxed, imgs)]
+
+    def postprocess(self, output, scale, pad, img_size, conf, iou, classes):
+        """
+        Decode the raw output of one image, (4 + classes, anchors), into xyxy boxes.
+
+        Args:
+            output (np.ndarray): Raw model output for the image
+            scale (float): Scale factor of the letterbox
+            pad (tuple): (left, top) padding of the letterbox
+            img_size (tuple): (width, height) of the original image
+            conf (float): Confidence threshold
+            iou (float): IoU threshold of NMS
+            classes (list): Class IDs to keep (None: all)
+
+        Returns:
+            np.ndarray: (N, 4) float32 boxes
+        """
+        predictions = output.T
+        scores = predictions[:, 4:]
+        class_ids = np.arange(scores.shape[1])
+        if classes is not None:
+            scores = scores[:, classes]
+            class_ids = class_ids[classes]
+
+        best = scores.argmax(axis=1)
+        confidence = scores[np.arange(len(scores)), best]
+        candidates = confidence > conf
+        if not candidates.any():
+            return np.zeros((0, 4), dtype=np.float32)
+
+        cx, cy, w, h = predictions[candidates, :4].T
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        confidence = confidence[candidates]
+        offsets = class_ids[best[candidates]][:, None] * MAX_WH
+
+        keep = nms(boxes + offsets, confidence, iou)[:MAX_DET]
+        boxes = boxes[keep]
+
+        # Undo the letterbox
+        boxes -= np.array([pad[0], pad[1], pad[0], pad[1]], dtype=boxes.dtype)
+        boxes /= scale
+        width, height = img_size
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+        return boxes.astype(np.float32)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+""" Compare the detections of the ONNX backend with those of the PyTorch backend.
+
+Usage: python3 parity_check.py [--weights yolov8n.pt] [--onnx yolov8n.onnx] [--runs 5] [IMAGE ...]
+
+IMAGEs are image files or JSON inputs with an "img" field (default: the
+inputs of the resize function). Boxes are matched by IoU; the check fails
+if an image has a different number of people, or a matched pair of boxes
+has an IoU below --min-iou. Inference throughput of both backends is also
+reported.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("YOLO_WARMUP", "false")
+os.environ.setdefault("EXECUTOR_LOG_LEVEL", "quiet")
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+import numpy as np
+
+import function
+
+RESIZE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resize")
+DEFAULT_IMAGES = [os.path.join(RESIZE_DIR, "input.json"), os.path.join(RESIZE_DIR, "input-car.json")]
+
+
+def load_image(path):
+    if path.endswith(".json"):
+        with open(path) as f:
+            return function.decode_base64_image(json.load(f)["img"])
+    with open(path, "rb") as f:
+        return function.decode_image_bytes(f.read())
+
+
+def iou_matrix(a, b):
+    """IoU of each box of a (N, 4) with each box of b (M, 4)"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match(reference, candidate):
+    """IoU of the greedily matched pairs of boxes"""
+    if len(reference) == 0 or len(candidate) == 0:
+        return []
+    ious = iou_matrix(np.array(reference), np.array(candidate))
+    matched = []
+    for _ in range(min(ious.shape)):
+        i, j = np.unravel_index(ious.argmax(), ious.shape)
+        matched.append(float(ious[i, j]))
+        ious[i, :] = -1
+        ious[:, j] = -1
+    return matched
+
+
+def throughput(model, imgs, runs):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        for img in imgs:
+            function.detect_people([img], model)
+        best = min(best, time.perf_counter() - start)
+    return len(imgs) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the ONNX and the PyTorch backends")
+    parser.add_argument("images", nargs="*", default=DEFAULT_IMAGES)
+    parser.add_argument("--weights", default="yolov8n.pt")
+    parser.add_argument("--onnx", default="yolov8n.onnx")
+    parser.add_argument("--min-iou", type=float, default=0.9)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    imgs = [load_image(path) for path in args.images]
+    torch_model = function.get_model(args.weights, "torch")
+    onnx_model = function.get_model(args.onnx, "onnx")
+
+    ok = True
+    print(f"{'image':<30}{'torch':>8}{'onnx':>8}{'min. IoU':>10}")
+    for path, img in zip(args.images, imgs):
+        reference = function.detect_people([img], torch_model)[0]
+        candidate = function.detect_people([img], onnx_model)[0]
+        ious = match(reference, candidate)
+        min_iou = min(ious) if ious else float("nan")
+        ok &= len(reference) == len(candidate) and all(iou >= args.min_iou for iou in ious)
+        print(f"{os.path.basename(path):<30}{len(reference):>8}{len(candidate):>8}{min_iou:>10.3f}")
+
+    print(f"> Throughput (img/s): torch {throughput(torch_model, imgs, args.runs):.1f}, "
+          f"onnx {throughput(onnx_model, imgs, args.runs):.1f}")
+    print("> Parity check " + ("passed" if ok else "FAILED"))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import builtins
+import contextlib
+import os
+import sys
+import threading
+import time
+
+# Record the import time of every module (adds a small overhead to each import)
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "false").lower() == "true"
+
+# Reference time: the import of this module, which executors import first
+T0 = time.perf_counter()
+
+_lock = threading.Lock()
+# Time (since T0) of events, e.g., the first request
+_events = {}
+# Duration of phases, e.g., the import of the function or the load of a model
+_phases = {}
+# Self and cumulative import time of each module
+_imports = {}
+_import_stack = threading.local()
+_real_import = builtins.__import__
+
+
+def _process_age():
+    """Seconds elapsed between the start of this process and T0, if known (Linux only)"""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except Exception:
+        return None
+
+_interpreter_seconds = _process_age()
+
+
+def mark(name):
+    """Record the time of an event (only its first occurrence)"""
+    with _lock:
+        _events.setdefault(name, time.perf_counter() - T0)
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Measure the duration of a phase; repeated phases are accumulated"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            p = _phases.setdefault(name, {"start": start - T0, "count": 0, "seconds": 0.0})
+            p["count"] += 1
+            p["seconds"] += elapsed
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level > 0 or name in sys.modules:
+        return _real_import(name, globals, locals, fromlist, level)
+
+    stack = _import_stack.__dict__.setdefault("stack", [])
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _real_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        children = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        if name in sys.modules:
+            with _lock:
+                _imports[name] = {"self": elapsed - children, "cumulative": elapsed}
+
+
+def install_import_hook():
+    """Record the import time of the modules imported from now on (as `python -X importtime`)"""
+    builtins.__import__ = _timed_import
+
+
+def report(top=30):
+    """Startup timings: events and phases (seconds since T0), and the slowest imports"""
+    with _lock:
+        imports = sorted(_imports.items(), key=lambda i: i[1]["cumulative"], reverse=True)
+        return {"Profile": STARTUP_PROFILE,
+                "InterpreterSeconds": _interpreter_seconds,
+                "UptimeSeconds": time.perf_counter() - T0,
+                "Events": dict(_events),
+                "Phases": {name: dict(p) for name, p in _phases.items()},
+                "Imports": [dict(module=name, **t) for name, t in imports[:top]]}
+
+
+if STARTUP_PROFILE:
+    install_import_hook()
@@ -0,0 +1,103 @@
+import contextlib
+import os
+import tempfile
+from PIL import Image
+import storage
+
+# Directory where videos passed by reference are downloaded (removed after the invocation)
+VIDEO_TMP_DIR = os.getenv("VIDEO_TMP_DIR", tempfile.gettempdir())
+# Directory of the videos that can be read by path, e.g., a shared volume (empty: only by key)
+VIDEO_DIR = os.getenv("VIDEO_DIR", "")
+
+
+def resolve_path(path, video_dir=VIDEO_DIR):
+    """Absolute path of a video below video_dir (path can be relative to it); other paths are rejected"""
+    if not video_dir:
+        raise Exception("Videos cannot be read by path: VIDEO_DIR is not set")
+    root = os.path.realpath(video_dir)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise Exception(f"Video {path} is not in VIDEO_DIR")
+    return resolved
+
+
+@contextlib.contextmanager
+def local_video(params):
+    """
+    Path of the video of an invocation: "video_path" (a local file below
+    VIDEO_DIR), or "video_key" (an object, downloaded to a temporary file).
+    """
+    if "video_path" in params:
+        yield resolve_path(params["video_path"])
+        return
+
+    key = params["video_key"]
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(key)[1] or ".mp4", dir=VIDEO_TMP_DIR)
+    os.close(fd)
+    try:
+        if not storage.store.get_file(key, path):
+            raise Exception(f"Cannot download video {key}")
+        yield path
+    finally:
+        os.remove(path)
+
+
+class VideoFrames:
+    """
+    Sampled frames of a video, decoded one at a time (only the frames being
+    processed are kept in memory). Iterating yields (frame index, seconds,
+    RGB image, scale), where frames larger than max_size are downscaled by
+    scale before being converted.
+
+    Frames are sampled every `every` frames, or `fps` times per second of
+    video if fps > 0; at most `max_frames` are returned (0: all).
+    """
+
+    def __init__(self, path, every=1, fps=0, max_frames=0, max_size=0):
+        import cv2
+        self.cv2 = cv2
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise Exception(f"Cannot open video {path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 0.0
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if fps > 0 and self.fps > 0:
+            self.step = max(1, round(self.fps / fps))
+        else:
+            self.step = max(1, every)
+        self.max_frames = max_frames
+        self.max_size = max_size
+
+    def __iter__(self):
+        cv2 = self.cv2
+        index = sampled = 0
+        while not self.max_frames or sampled < self.max_frames:
+            if index % self.step:
+                # Skipped frames are not converted
+                if not self.cap.grab():
+                    break
+                index += 1
+                continue
+
+            ok, frame = self.cap.read()
+            if not ok:
+                break
+            height, width = frame.shape[:2]
+            scale = 1.0
+            if self.max_size and max(width, height) > self.max_size:
+                scale = self.max_size / max(width, height)
+                frame = cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+            img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            yield index, index / self.fps if self.fps else 0.0, img, scale
+            sampled += 1
+            index += 1
+
+    def close(self):
+        self.cap.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
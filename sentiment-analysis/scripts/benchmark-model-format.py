@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+''' Compare the pickle and the compact model formats: artifact size, cold-start time, and predictions.
+
+Usage: python3 benchmark-model-format.py <sentiment_model.pkl> <tfidf_vectorizer.pkl> [runs]
+
+The pickled files are those produced by the train task with MODEL_FORMAT=pickle. They are converted
+to the compact format in a temporary directory; each load is measured in a new Python process,
+so that the times include the import of the modules (as in a cold start).
+'''
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+REVIEWS = ["Great product, works as expected", "Broke after two days", "Not bad, but the battery could last longer"]
+
+COLD_START = '''
+import json
+import time
+start = time.perf_counter()
+import ml_model
+imported = time.perf_counter()
+model, vectorizer = ml_model.load_model_and_vectorizer({model!r}, {vectorizer!r})
+loaded = time.perf_counter()
+labels, proba_positive, _ = ml_model.predict_sentiments({reviews!r}, vectorizer, model)
+predicted = time.perf_counter()
+print(json.dumps({{"import": imported - start, "load": loaded - imported, "predict": predicted - loaded,
+                  "labels": labels, "proba_positive": proba_positive}}))
+'''
+
+
+def cold_start(model_file, vectorizer_file):
+    code = COLD_START.format(model=model_file, vectorizer=vectorizer_file, reviews=REVIEWS)
+    env = dict(os.environ, STORAGE_BACKEND="memory")
+    out = subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR, env=env, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    model_file = os.path.abspath(sys.argv[1])
+    vectorizer_file = os.path.abspath(sys.argv[2])
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    sys.path.insert(0, SRC_DIR)
+    os.environ["STORAGE_BACKEND"] = "memory"
+    import ml_model
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model, vectorizer = ml_model.load_model_and_vectorizer(model_file, vectorizer_file)
+        compact_model_file = os.path.join(tmp, "sentiment_model.bin")
+        compact_vectorizer_file = os.path.join(tmp, "tfidf_vectorizer.bin")
+        ml_model.save_model(model, vectorizer, compact_model_file, compact_vectorizer_file, model_format="compact")
+
+        formats = {"pickle": (model_file, vectorizer_file),
+                   "compact": (compact_model_file, compact_vectorizer_file)}
+        predictions = {}
+        print(f"{'format':<10}{'size (KiB)':>12}{'import (s)':>12}{'load (s)':>12}{'predict (s)':>12}")
+        for name, (m, v) in formats.items():
+            size = (os.path.getsize(m) + os.path.getsize(v)) / 1024
+            results = [cold_start(m, v) for _ in range(runs)]
+            import_time, load_time, predict_time = (min(r[phase] for r in results) for phase in ("import", "load", "predict"))
+            predictions[name] = results[0]
+            print(f"{name:<10}{size:>12.1f}{import_time:>12.4f}{load_time:>12.4f}{predict_time:>12.4f}")
+
+        same_labels = predictions["pickle"]["labels"] == predictions["compact"]["labels"]
+        max_diff = max(abs(a - b) for a, b in zip(predictions["pickle"]["proba_positive"], predictions["compact"]["proba_positive"]))
+        print(f"> Same labels: {same_labels}; max. difference of the probabilities: {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
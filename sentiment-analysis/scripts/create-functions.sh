@@ -49,6 +49,27 @@ SERVERLEDGE_CLI="${1:-../../../serverledge/bin/serverledge-cli}"
 
 
 
+"$SERVERLEDGE_CLI" create --function sa_train_sweep \
+    --memory 2048 \
+    --runtime custom \
+    --custom_image sa-sentiment-analysis-train-sweep \
+    --input "subset:Float" \
+    --input "max_features_grid:ArrayInt" \
+    --input "c_grid:ArrayFloat" \
+    --input "train_object_data:Text" \
+    --input "local_train_file:Text" \
+    --input "test_object_data:Text" \
+    --input "local_test_file:Text" \
+    --output "status:Text" \
+    --output "max_features:ArrayInt" \
+    --output "C:ArrayFloat" \
+    --output "accuracy:ArrayFloat" \
+    --output "best_max_features:Int" \
+    --output "best_C:Float" \
+    --output "best_accuracy:Float"
+
+
+
 "$SERVERLEDGE_CLI" create --function sa_evaluate \
     --memory 512 \
     --runtime custom \
@@ -63,4 +84,20 @@ SERVERLEDGE_CLI="${1:-../../../serverledge/bin/serverledge-cli}"
     --output "status:Text" \
     --output "accuracy:Float"
 
+
+
+"$SERVERLEDGE_CLI" create --function sa_predict \
+    --memory 512 \
+    --runtime custom \
+    --custom_image sa-sentiment-analysis-predict \
+    --input "reviews:ArrayText" \
+    --input "local_model_file:Text" \
+    --input "local_vectorizer_file:Text" \
+    --input "input_model_object:Text" \
+    --input "input_vectorizer_object:Text" \
+    --output "status:Text" \
+    --output "sentiments:ArrayText" \
+    --output "confidence_positive:ArrayFloat" \
+    --output "confidence_negative:ArrayFloat"
+
 ## TODO: How to support environment variables? 
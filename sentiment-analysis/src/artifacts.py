@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import storage
+
+# Local directory where artifacts are cached, and its maximum size
+CACHE_DIR       = os.getenv("ARTIFACT_CACHE_DIR", "/tmp/artifacts")
+CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", str(4 * 1024 * 1024 * 1024)))
+
+# Suffix of the objects recording the key of a published artifact
+KEY_SUFFIX = ".key"
+
+
+def artifact_key(**inputs):
+    ''' Key of an artifact: a hash of all the inputs it is produced from (URLs, object keys, subset, seed,
+    hyperparameters, ...). '''
+    data = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:32]
+
+
+def object_key(object_name):
+    ''' Key of an object in the store, derived from its name and ETag. Returns None if it does not exist. '''
+    st = storage.store.stat(object_name)
+    if st is None:
+        return None
+    return artifact_key(object=object_name, etag=st["etag"])
+
+
+def published_key(object_name):
+    ''' Key recorded when the object was published, or None. '''
+    try:
+        return storage.store.get(object_name + KEY_SUFFIX).decode("utf-8")
+    except:
+        return None
+
+
+def is_published(object_name, key):
+    ''' Whether the object exists and was produced from the inputs identified by key. '''
+    return published_key(object_name) == key and storage.store.exists(object_name)
+
+
+def mark(object_name, key):
+    ''' Record the key of an object already stored. '''
+    storage.store.put(object_name + KEY_SUFFIX, key.encode("utf-8"), content_type="text/plain")
+
+
+def publish(local_path, object_name, key):
+    ''' Upload an artifact and record its key. '''
+    storage.store.put_file(local_path, object_name, override=True)
+    mark(object_name, key)
+
+
+class LocalCache:
+    ''' Content-addressed cache of artifacts on the local disk.
+
+    Artifacts are stored as `<root>/<key>/<name>`, so a file is reused only when it was produced
+    from the same inputs. When the cache grows beyond `max_bytes`, the least recently used files are evicted.
+    '''
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def path(self, key, name):
+        return os.path.join(self.root, key, os.path.basename(name))
+
+    def lookup(self, key, name):
+        ''' Return the path of a cached artifact, or None. '''
+        path = self.path(key, name)
+        try:
+            # The modification time tracks the last use
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        print(f"> Using cached artifact: {path}")
+        return path
+
+    def add(self, key, name, local_path):
+        ''' Move a local file into the cache. Returns its new path. '''
+        path = self.path(key, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(local_path, path)
+        self.evict(keep=path)
+        return path
+
+    def fetch(self, object_name, name=None):
+        ''' Return a local copy of an object, downloading it only if the cached copy is missing or stale. '''
+        key = object_key(object_name)
+        if key is None:
+            raise Exception(f"> Object not found: {object_name}")
+        name = name or object_name
+        path = self.lookup(key, name)
+        if path is not None:
+            return path
+
+        path = self.path(key, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        print(f"> Downloading {object_name} -> {path}")
+        if not storage.store.get_file(object_name, tmp_path):
+            raise Exception(f"> Error while downloading {object_name}.")
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        ''' Remove the least recently used files until the cache fits in max_bytes. '''
+        with self.lock:
+            files = []
+            for dirpath, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, path))
+
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                print(f"> Evicting cached artifact: {path}")
+                os.remove(path)
+                try:
+                    os.rmdir(os.path.dirname(path))
+                except OSError:
+                    pass
+                total -= size
+
+
+# Cache shared by all the handlers of this process
+cache = LocalCache()
@@ -0,0 +1,205 @@
+import json
+import re
+import struct
+import numpy as np
+from scipy import sparse
+from scipy.special import expit
+
+# First bytes of a file in the compact format
+MAGIC = b"SACOMPACT1\n"
+# Arrays are aligned, so that they can be memory-mapped
+ALIGNMENT = 64
+
+
+def write_arrays(path, meta, arrays):
+    ''' Write `meta` (a JSON-serializable dict) and a dict of NumPy arrays to a file in the compact format.
+
+    Layout: MAGIC, the length of the header (uint32), the JSON header, then the raw arrays.
+    '''
+    arrays = {name: np.ascontiguousarray(a) for name, a in arrays.items()}
+
+    # Offsets depend on the header length, which depends on the offsets: compute them until stable
+    offsets = {name: 0 for name in arrays}
+    while True:
+        header = json.dumps({"meta": meta, "arrays": {name: {"dtype": a.dtype.str, "shape": list(a.shape), "offset": offsets[name]}
+                                                      for name, a in arrays.items()}}).encode("utf-8")
+        offset = len(MAGIC) + 4 + len(header)
+        new_offsets = {}
+        for name, a in arrays.items():
+            offset += -offset % ALIGNMENT
+            new_offsets[name] = offset
+            offset += a.nbytes
+        if new_offsets == offsets:
+            break
+        offsets = new_offsets
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for name, a in arrays.items():
+            f.write(b"\0" * (offsets[name] - f.tell()))
+            f.write(a.tobytes())
+
+
+def is_compact(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_arrays(path):
+    ''' Return the metadata and the memory-mapped arrays of a file in the compact format '''
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a compact model file: {path}")
+        (length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(length))
+
+    arrays = {}
+    for name, a in header["arrays"].items():
+        dtype = np.dtype(a["dtype"])
+        shape = tuple(a["shape"])
+        if np.prod(shape, dtype=np.int64) == 0 or dtype.itemsize == 0:
+            arrays[name] = np.empty(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=a["offset"], shape=shape)
+    return header["meta"], arrays
+
+
+def rows_of(X):
+    ''' Row index of each stored entry of a CSR matrix '''
+    return np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+
+
+class CompactVectorizer:
+    ''' TF-IDF vectorizer backed by a sorted vocabulary and an IDF array, as exported by `save_vectorizer`.
+
+    It produces the same matrices as the TfidfVectorizer it was exported from: n-grams are looked up
+    with a binary search in the sorted vocabulary (UTF-8 encoded), so no dict is built when loading.
+    '''
+
+    def __init__(self, meta, terms, idf):
+        self.ngram_range = tuple(meta["ngram_range"])
+        self.lowercase = meta["lowercase"]
+        self.token_pattern = re.compile(meta["token_pattern"])
+        self.norm = meta["norm"]
+        self.sublinear_tf = meta["sublinear_tf"]
+        self.terms = terms
+        self.idf = idf
+
+    def analyze(self, doc):
+        if self.lowercase:
+            doc = doc.lower()
+        tokens = self.token_pattern.findall(doc)
+        min_n, max_n = self.ngram_range
+        grams = []
+        for n in range(min_n, max_n + 1):
+            grams.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return grams
+
+    def transform(self, raw_documents):
+        width = self.terms.dtype.itemsize
+        rows, grams = [], []
+        n_docs = 0
+        for row, doc in enumerate(raw_documents):
+            n_docs += 1
+            for gram in self.analyze(doc):
+                gram = gram.encode("utf-8")
+                # Longer n-grams cannot be in the vocabulary (and would be truncated by the cast)
+                if len(gram) <= width:
+                    grams.append(gram)
+                    rows.append(row)
+
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.zeros(len(rows), dtype=np.int64)
+        if len(rows) > 0:
+            found = np.zeros(len(rows), dtype=bool)
+            if len(self.terms) > 0:
+                grams = np.array(grams, dtype=self.terms.dtype)
+                cols = np.searchsorted(self.terms, grams).clip(max=len(self.terms) - 1)
+                found = self.terms[cols] == grams
+            rows, cols = rows[found], cols[found]
+
+        # Duplicate entries are summed, giving the term counts
+        X = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n_docs, len(self.terms)))
+        X.sum_duplicates()
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+        if self.idf is not None:
+            X.data *= self.idf[X.indices]
+        if self.norm is not None:
+            norms = np.sqrt(np.bincount(rows_of(X), X.data ** 2, minlength=n_docs)) if self.norm == "l2" \
+                else np.bincount(rows_of(X), np.abs(X.data), minlength=n_docs)
+            norms[norms == 0] = 1
+            X.data /= np.repeat(norms, np.diff(X.indptr))
+        return X
+
+
+class CompactModel:
+    ''' Binary linear classifier with a logistic link, backed by raw coefficient arrays '''
+
+    def __init__(self, coef, intercept, classes):
+        self.coef_ = coef
+        self.intercept_ = intercept
+        self.classes_ = classes
+
+    def decision_function(self, X):
+        return np.asarray(X @ self.coef_[0]).ravel() + self.intercept_[0]
+
+    def predict_proba(self, X):
+        p = expit(self.decision_function(X))
+        return np.column_stack([1 - p, p])
+
+    def predict(self, X):
+        return self.classes_[(self.decision_function(X) > 0).astype(int)]
+
+
+def can_save_vectorizer(vectorizer):
+    ''' Whether a TfidfVectorizer only uses options supported by CompactVectorizer '''
+    return (hasattr(vectorizer, "vocabulary_") and hasattr(vectorizer, "idf_")
+            and vectorizer.analyzer == "word" and vectorizer.tokenizer is None and vectorizer.preprocessor is None
+            and vectorizer.stop_words is None and vectorizer.strip_accents is None and not vectorizer.binary
+            and vectorizer.norm in ("l1", "l2", None))
+
+
+def can_save_model(model):
+    ''' Whether a model is a binary classifier whose probabilities are the sigmoid of its decision function '''
+    return (type(model).__name__ == "LogisticRegression" and model.solver == "liblinear"
+            and len(model.classes_) == 2 and model.coef_.shape[0] == 1)
+
+
+def save_vectorizer(vectorizer, path):
+    # Sorted UTF-8 terms, and the IDF of each term in the same order
+    terms = sorted(vectorizer.vocabulary_, key=lambda t: t.encode("utf-8"))
+    columns = np.array([vectorizer.vocabulary_[t] for t in terms], dtype=np.int64)
+    meta = {"type": "tfidf_vectorizer",
+            "ngram_range": list(vectorizer.ngram_range),
+            "lowercase": vectorizer.lowercase,
+            "token_pattern": vectorizer.token_pattern,
+            "norm": vectorizer.norm,
+            "sublinear_tf": vectorizer.sublinear_tf}
+    arrays = {"terms": np.array([t.encode("utf-8") for t in terms], dtype=bytes)}
+    if vectorizer.use_idf:
+        arrays["idf"] = np.asarray(vectorizer.idf_, dtype=np.float64)[columns]
+    write_arrays(path, meta, arrays)
+    return columns
+
+
+def save_model(model, path, columns):
+    ''' Save a model; `columns` maps the features of the compact vectorizer to the columns of the model '''
+    meta = {"type": "linear_model"}
+    arrays = {"coef": np.asarray(model.coef_, dtype=np.float64)[:, columns],
+              "intercept": np.asarray(model.intercept_, dtype=np.float64),
+              "classes": np.asarray(model.classes_)}
+    write_arrays(path, meta, arrays)
+
+
+def load_vectorizer(path):
+    meta, arrays = read_arrays(path)
+    return CompactVectorizer(meta, arrays["terms"], arrays.get("idf"))
+
+
+def load_model(path):
+    _, arrays = read_arrays(path)
+    return CompactModel(arrays["coef"], arrays["intercept"], np.asarray(arrays["classes"]))
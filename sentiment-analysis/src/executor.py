@@ -1,9 +1,18 @@
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import startup
+import metrics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import importlib
 import os
 import json
-import retriever
-import ml_model
-import extractor
+import sys
+import threading
+import time
+import storage
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 hostName = "0.0.0.0"
 serverPort = 8080
@@ -14,17 +23,249 @@ OBJECT_NAME = os.getenv("OBJECT_NAME", "raw/amazon_review_polarity_csv.tgz")
 
 HANDLER_ENV = os.getenv("HANDLER_ENV")
 
+# Max. number of requests handled at the same time (0: unlimited)
+MAX_CONCURRENCY = int(os.getenv("EXECUTOR_CONCURRENCY", "1"))
+# Max. number of requests waiting for a free slot before rejecting new ones (-1: unlimited)
+MAX_QUEUE = int(os.getenv("EXECUTOR_QUEUE", "-1"))
+# Import the module of HANDLER_ENV in background as soon as the server is listening (otherwise, at the first request)
+PRELOAD = os.getenv("EXECUTOR_PRELOAD", "true").lower() == "true"
+# Add the duration of each phase to every response (otherwise, only when requested with "ReturnTimings")
+RETURN_TIMINGS = os.getenv("EXECUTOR_TIMINGS", "false").lower() == "true"
+# Embed the result in the response as a JSON value instead of a JSON-encoded string (otherwise, only when requested
+# with "RawResult"). Serverledge expects a string, so only direct clients should enable it
+RAW_RESULT = os.getenv("EXECUTOR_RAW_RESULT", "false").lower() == "true"
+
+def json_loads(data):
+    """Decode JSON from bytes-like objects without copying them (with orjson, if available)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj):
+    """Encode to JSON bytes (with orjson, if available)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            pass
+    return json.dumps(obj).encode("utf-8")
+
+def read_body(rfile, length):
+    """Read the request body into a single preallocated buffer"""
+    body = bytearray(length)
+    view = memoryview(body)
+    pos = 0
+    while pos < length:
+        n = rfile.readinto(view[pos:])
+        if not n:
+            break
+        pos += n
+    view.release()
+    if pos < length:
+        del body[pos:]
+    return body
+
+# Module implementing each function
+MODULES = {"retrieve": "retriever", "extract": "extractor", "train": "ml_model", "train_sweep": "ml_model", 
+           "evaluate": "ml_model", "predict": "ml_model"}
+
+# Modules imported so far
+_modules = {}
+_modules_lock = threading.Lock()
+
+def load_module(name):
+    """Import a module on first use, so that heavy imports (pandas, sklearn) do not delay the server startup"""
+    module = _modules.get(name)
+    if module is None:
+        with _modules_lock:
+            module = _modules.get(name)
+            if module is None:
+                with startup.phase(f"import_{name}"):
+                    module = importlib.import_module(name)
+                _modules[name] = module
+    return module
+
+def preload():
+    if HANDLER_ENV is not None and HANDLER_ENV.lower() in MODULES:
+        load_module(MODULES[HANDLER_ENV.lower()])
+        startup.mark("function_ready")
+
+# Output of the handlers: "info" prints it, "quiet" discards it (unless it is returned with ReturnOutput)
+LOG_LEVEL = os.getenv("EXECUTOR_LOG_LEVEL", "info").lower()
+# Max. characters of stdout (and of stderr) returned per invocation
+MAX_OUTPUT = int(os.getenv("EXECUTOR_MAX_OUTPUT", str(64 * 1024)))
+
+# Output capture of the invocation handled by the current thread
+_output = threading.local()
+
+class _Capture:
+    """Output of an invocation, bounded to MAX_OUTPUT characters per stream"""
+
+    def __init__(self, limit=MAX_OUTPUT):
+        self.limit = limit
+        self.parts = {"stdout": [], "stderr": []}
+        self.sizes = {"stdout": 0, "stderr": 0}
+        self.dropped = {"stdout": 0, "stderr": 0}
+
+    def write(self, stream, text):
+        room = self.limit - self.sizes[stream]
+        if room > 0:
+            self.parts[stream].append(text[:room])
+            self.sizes[stream] += min(room, len(text))
+        self.dropped[stream] += max(0, len(text) - max(room, 0))
+        return len(text)
+
+    def getvalue(self, stream):
+        value = "".join(self.parts[stream])
+        if self.dropped[stream]:
+            value += f"\n... [{self.dropped[stream]} characters truncated]"
+        return value
+
+class _Discard:
+    def write(self, stream, text):
+        return len(text)
+
+class OutputRouter:
+    """
+    Replaces sys.stdout/sys.stderr: writes go to the capture of the invocation
+    handled by the current thread, if any, and to the original stream otherwise.
+    """
+
+    def __init__(self, stream, name):
+        self.stream = stream
+        self.name = name
+
+    def write(self, text):
+        capture = getattr(_output, "capture", None)
+        if capture is None:
+            return self.stream.write(text)
+        return capture.write(self.name, text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+sys.stdout = OutputRouter(sys.stdout, "stdout")
+sys.stderr = OutputRouter(sys.stderr, "stderr")
+
+class CaptureOutput:
+    """Capture the output of the current thread (other invocations are not affected)"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._capture = None
+
+    def __enter__(self):
+        if self.enabled:
+            self._capture = _Capture()
+        elif LOG_LEVEL == "quiet":
+            self._capture = _Discard()
+        _output.capture = self._capture
+        return self
+
+    def __exit__(self, *args):
+        _output.capture = None
+
+    def get_stdout(self):
+        return self._capture.getvalue("stdout") if self.enabled else ""
+
+    def get_stderr(self):
+        return self._capture.getvalue("stderr") if self.enabled else ""
+
+class Server(ThreadingHTTPServer):
+    """
+    HTTP server that accepts connections concurrently, but runs at most
+    `concurrency` handlers at the same time. Requests waiting for a slot are
+    queued; once `max_queue` requests are waiting, new ones are rejected.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, handler_class, concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE):
+        super().__init__(address, handler_class)
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.slots = threading.BoundedSemaphore(concurrency) if concurrency > 0 else None
+        self.stats_lock = threading.Lock()
+        self.running = 0
+        self.queued = 0
+        self.rejected = 0
+        self.served = 0
+
+    def acquire(self):
+        """Wait for a free handler slot. Returns False if the request is rejected."""
+        if self.slots is not None and not self.slots.acquire(blocking=False):
+            with self.stats_lock:
+                if 0 <= self.max_queue <= self.queued:
+                    self.rejected += 1
+                    return False
+                self.queued += 1
+            self.slots.acquire()
+            with self.stats_lock:
+                self.queued -= 1
+        with self.stats_lock:
+            self.running += 1
+        return True
+
+    def release(self):
+        with self.stats_lock:
+            self.running -= 1
+            self.served += 1
+        if self.slots is not None:
+            self.slots.release()
+
+    def stats(self):
+        with self.stats_lock:
+            return {"Concurrency": self.concurrency, "MaxQueue": self.max_queue,
+                    "Running": self.running, "Queued": self.queued,
+                    "Rejected": self.rejected, "Served": self.served}
+
 class Executor(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if "metrics" in self.path:
+            self.send_response(200)
+            self.send_header("Content-type", "text/plain; version=0.0.4")
+            self.end_headers()
+            self.wfile.write(metrics.render(self.server.stats()).encode("utf-8"))
+            return
+
+        if "startup" in self.path:
+            status = startup.report()
+        elif "status" in self.path:
+            status = self.server.stats()
+            status["Storage"] = storage.store.get_stats()
+            if "ml_model" in _modules:
+                status["Models"] = _modules["ml_model"].registry.get_stats()
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(bytes(json.dumps(status), "utf-8"))
+
     def do_POST(self):
+        startup.mark("first_request")
+        read_seconds = decode_seconds = None
         content_length = 0
         post_data = None
         request = { }
         raw_content_length = self.headers['Content-Length']
         if raw_content_length:
             content_length = int(raw_content_length)
-            post_data = self.rfile.read(content_length)
-            print(f" POST: Received post_data: {post_data}")
-            request = json.loads(post_data.decode('utf-8'))
+            start = time.perf_counter()
+            post_data = read_body(self.rfile, content_length)
+            read_seconds = time.perf_counter() - start
+            metrics.record("read", read_seconds)
+            if LOG_LEVEL != "quiet":
+                print(f" POST: Received post_data: {post_data}")
+            start = time.perf_counter()
+            request = json_loads(post_data)
+            decode_seconds = time.perf_counter() - start
+            metrics.record("json_decode", decode_seconds)
 
         if not "invoke" in self.path:
             self.send_response(404)
@@ -45,111 +286,195 @@ class Executor(BaseHTTPRequestHandler):
         else:
             context = {}
 
+        try:
+            return_timings = RETURN_TIMINGS or bool(request["ReturnTimings"])
+        except:
+            return_timings = RETURN_TIMINGS
+        try:
+            raw_result = RAW_RESULT or bool(request["RawResult"])
+        except:
+            raw_result = RAW_RESULT
+        try:
+            return_output = bool(request["ReturnOutput"])
+        except:
+            return_output = False
+
+        start = time.perf_counter()
+        if not self.server.acquire():
+            self.send_response(503)
+            self.end_headers()
+            return
+        queue_seconds = time.perf_counter() - start
+        metrics.record("queue", queue_seconds)
+
+        # Phases of this invocation are collected only if they are returned
+        metrics.begin(return_timings)
+        if return_timings:
+            if read_seconds is not None:
+                metrics.add("read", read_seconds)
+                metrics.add("json_decode", decode_seconds)
+            metrics.add("queue", queue_seconds)
+
         response = {}
         try:
-            if func is None and HANDLER_ENV is None:
-                raise Exception("function not defined!")
+            start = time.perf_counter()
+            with CaptureOutput(enabled=return_output) as capturer:
+                if func is None and HANDLER_ENV is None:
+                    raise Exception("function not defined!")
             
-            if func == "retrieve" or HANDLER_ENV.lower() == "retrieve":
-                ''' Invocation example: 
+                if func == "retrieve" or HANDLER_ENV.lower() == "retrieve":
+                    ''' Invocation example: 
                 
-                    POST localhost:8080/invoke
-                    {
-                        "Function" : "retrieve",
-                        "Params" : {
-                            "data_url": "https://s3.amazonaws.com/fast-ai-nlp/amazon_review_polarity_csv.tgz", 
-                            "local_dir": "./amazon_review_polarity_csv.tgz", 
-                            "object_name": "raw/amazon_review_polarity_csv.tgz"
+                        POST localhost:8080/invoke
+                        {
+                            "Function" : "retrieve",
+                            "Params" : {
+                                "data_url": "https://s3.amazonaws.com/fast-ai-nlp/amazon_review_polarity_csv.tgz", 
+                                "local_dir": "./amazon_review_polarity_csv.tgz", 
+                                "object_name": "raw/amazon_review_polarity_csv.tgz"
+                            }
                         }
-                    }
-                '''
-                data_url = str(params.get("data_url", DATA_URL))
-                local_temp_dir = str(params.get("local_dir", OUTPUT_PATH))
-                data_object_name = str(params.get("object_name", OBJECT_NAME))
+                    '''
+                    data_url = str(params.get("data_url", DATA_URL))
+                    local_temp_dir = str(params.get("local_dir", OUTPUT_PATH))
+                    data_object_name = str(params.get("object_name", OBJECT_NAME))
                 
-                print(f"Running function 'retriever' with params {data_url}, {local_temp_dir}, {data_object_name}")
-                result = retriever.handler(data_url=data_url, local_temp_path=local_temp_dir, object_name=data_object_name)
+                    print(f"Running function 'retriever' with params {data_url}, {local_temp_dir}, {data_object_name}")
+                    result = load_module("retriever").handler(data_url=data_url, local_temp_path=local_temp_dir, object_name=data_object_name)
 
-            elif func == "train" or HANDLER_ENV.lower() == "train":
-                ''' Invocation example: 
+                elif func == "train" or HANDLER_ENV.lower() == "train":
+                    ''' Invocation example: 
                 
-                    POST localhost:8080/invoke
-                    {
-                        "Function" : "train",
-                        "Params" : {
-                            "subset": 0.001, 
-                            "max_features": 2, 
-                            "train_object_data": "data/train.csv", 
-                            "local_train_file": "train.csv", 
-                            "local_model_file": "sentiment_model.pkl", 
-                            "local_vectorizer_file": "tfidf_vectorizer.pkl",
-                            "output_model_object": "model/sentiment_model.pkl", 
-                            "output_vectorizer_object": "model/tfidf_vectorizer.pkl" 
+                        POST localhost:8080/invoke
+                        {
+                            "Function" : "train",
+                            "Params" : {
+                                "subset": 0.001, 
+                                "max_features": 2, 
+                                "train_object_data": "data/train.csv", 
+                                "local_train_file": "train.csv", 
+                                "local_model_file": "sentiment_model.pkl", 
+                                "local_vectorizer_file": "tfidf_vectorizer.pkl",
+                                "output_model_object": "model/sentiment_model.pkl", 
+                                "output_vectorizer_object": "model/tfidf_vectorizer.pkl" 
+                            }
                         }
-                    }
-                '''
-                print(f"Running function 'train' with params {params}")
-                result = ml_model.handler_train(params, context)
+                    '''
+                    print(f"Running function 'train' with params {params}")
+                    result = load_module("ml_model").handler_train(params, context)
 
-            elif func == "evaluate" or HANDLER_ENV.lower() == "evaluate":
-                ''' Invocation example: 
+                elif func == "train_sweep" or HANDLER_ENV.lower() == "train_sweep":
+                    ''' Invocation example: 
                 
-                    POST localhost:8080/invoke
-                    {
-                        "Function" : "evaluate",
-                        "Params" : {
-                            "test_object_data": "data/test.csv", 
-                            "local_test_file": "test.csv", 
-                            "subset": 0.0002, 
-                            "local_model_file": "sentiment_model.pkl", 
-                            "local_vectorizer_file": "tfidf_vectorizer.pkl", 
-                            "input_model_object": "model/sentiment_model.pkl", 
-                            "input_vectorizer_object": "model/tfidf_vectorizer.pkl"
+                        POST localhost:8080/invoke
+                        {
+                            "Function" : "train_sweep",
+                            "Params" : {
+                                "subset": 0.01, 
+                                "max_features_grid": [5000, 10000, 20000], 
+                                "c_grid": [0.1, 1.0, 10.0], 
+                                "train_object_data": "data/train.csv", 
+                                "test_object_data": "data/test.csv"
+                            }
                         }
-                    }
-                '''
-                print(f"Running function 'handle_evaluate' with params {params}, {context}")
-                result = ml_model.handler_evaluate(params, context)
+                    '''
+                    print(f"Running function 'train_sweep' with params {params}")
+                    result = load_module("ml_model").handler_train_sweep(params, context)
+
+                elif func == "evaluate" or HANDLER_ENV.lower() == "evaluate":
+                    ''' Invocation example: 
+                
+                        POST localhost:8080/invoke
+                        {
+                            "Function" : "evaluate",
+                            "Params" : {
+                                "test_object_data": "data/test.csv", 
+                                "local_test_file": "test.csv", 
+                                "subset": 0.0002, 
+                                "local_model_file": "sentiment_model.pkl", 
+                                "local_vectorizer_file": "tfidf_vectorizer.pkl", 
+                                "input_model_object": "model/sentiment_model.pkl", 
+                                "input_vectorizer_object": "model/tfidf_vectorizer.pkl"
+                            }
+                        }
+                    '''
+                    print(f"Running function 'handle_evaluate' with params {params}, {context}")
+                    result = load_module("ml_model").handler_evaluate(params, context)
+            
+                elif func == "predict" or HANDLER_ENV.lower() == "predict":
+                    ''' Invocation example: 
+                
+                        POST localhost:8080/invoke
+                        {
+                            "Function" : "predict",
+                            "Params" : {
+                                "reviews": ["Great product, works as expected", "Broke after two days"], 
+                                "input_model_object": "model/sentiment_model.pkl", 
+                                "input_vectorizer_object": "model/tfidf_vectorizer.pkl"
+                            }
+                        }
+                    '''
+                    result = load_module("ml_model").handler_predict(params, context)
             
-            elif func == "extract" or HANDLER_ENV.lower() == "extract": 
-                ''' Invocation example: 
+                elif func == "extract" or HANDLER_ENV.lower() == "extract": 
+                    ''' Invocation example: 
                 
-                    POST localhost:8080/invoke
-                    {
-                        "Function" : "extract",
-                        "Params" : {
-                            "tgz_input_object_name": "data/test.csv",
-                            "subset" : 0.002,
-                            "local_dataset_file": "./amazon_review_polarity_csv.tgz", 
-                            "local_output_dir": "./data", 
-                            "output_train_object_name": "data/train.csv",
-                            "output_test_object_name": "data/test.csv"
+                        POST localhost:8080/invoke
+                        {
+                            "Function" : "extract",
+                            "Params" : {
+                                "tgz_input_object_name": "data/test.csv",
+                                "subset" : 0.002,
+                                "local_dataset_file": "./amazon_review_polarity_csv.tgz", 
+                                "local_output_dir": "./data", 
+                                "output_train_object_name": "data/train.csv",
+                                "output_test_object_name": "data/test.csv"
+                            }
                         }
-                    }
-                '''
-                print(f"Running function 'extract' with params {params}, {context}")
-                result = extractor.handler(params, context)
+                    '''
+                    print(f"Running function 'extract' with params {params}, {context}")
+                    result = load_module("extractor").handler(params, context)
 
-            else:
-                raise Exception("Unsupported function")
+                else:
+                    raise Exception("Unsupported function")
+            metrics.record("handler", time.perf_counter() - start)
+            response["Output"] = capturer.get_stdout() + "\n" + capturer.get_stderr() if return_output else ""
               
-            response["Result"] = json.dumps(result)
+            start = time.perf_counter()
+            # The result is encoded once with the response, unless it must be sent as a string
+            response["Result"] = result if raw_result else json_dumps(result).decode("utf-8")
+            metrics.record("json_encode", time.perf_counter() - start)
             response["Success"] = True
         except Exception as e:
             print(e)
             response["Success"] = False
             response["Error"] = str(e)
+        finally:
+            self.server.release()
+            timings = metrics.end()
+
+        if return_timings:
+            response["Timings"] = timings
+
+        start = time.perf_counter()
+        body = json_dumps(response)
+        metrics.record("response_encode", time.perf_counter() - start)
 
         self.send_response(200)
         self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        self.wfile.write(bytes(json.dumps(response), "utf-8"))
+        self.wfile.write(body)
+        startup.mark("first_response")
 
 
 
 if __name__ == "__main__":      
     print("Launching HTTP Server... ")  
-    srv = HTTPServer((hostName, serverPort), Executor)
+    srv = Server((hostName, serverPort), Executor)
+    startup.mark("listening")
+    if PRELOAD:
+        threading.Thread(target=preload, daemon=True).start()
     try:
         print("Running server ... ")
         srv.serve_forever()
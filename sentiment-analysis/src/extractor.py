@@ -1,6 +1,8 @@
-import minio_client
-from pathlib import Path
+import artifacts
+import storage
+import io
 import os 
+import random
 import tarfile
 import pandas as pd
 
@@ -30,16 +32,73 @@ def sample_csv(input_file, output_file, subset=0.1, random_state=42):
     sampled_df.to_csv(output_file, index=False)
     print(f"> Sampled data saved to '{output_file}'")
 
+class SampledLines(io.RawIOBase):
+    ''' Readable stream returning each line of `source` with probability `subset` (Bernoulli sampling). 
+    
+    Records are assumed to be one per line, as in the Amazon Reviews CSV files. 
+    '''
+
+    def __init__(self, source, subset=1.0, random_state=42):
+        self.source = source
+        self.subset = subset
+        self.rng = random.Random(random_state)
+        self.buffer = bytearray()
+        self.lines = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while len(self.buffer) < len(b):
+            line = self.source.readline()
+            if not line:
+                break
+            if self.subset >= 1.0 or self.rng.random() < self.subset:
+                self.buffer.extend(line)
+                self.lines += 1
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        del self.buffer[:n]
+        return n
+
+
+def extract_streaming(tgz_input_object_name, outputs, subset=1.0, random_state=42):
+    ''' Read the archive as a stream from the object store, and upload a sample of the selected members. 
+    
+    Nothing is written to the local disk: each member in `outputs` (a dict mapping the member file name, 
+    e.g. 'train.csv', to the output object name) is sampled line by line while it is uploaded. 
+    '''
+    uploaded = set()
+    with storage.store.stream(tgz_input_object_name) as f:
+        with tarfile.open(fileobj=f, mode="r|gz") as tar:
+            for member in tar:
+                name = os.path.basename(member.name)
+                if not member.isfile() or name not in outputs:
+                    continue
+                
+                print(f"> Sampling and uploading '{member.name}' -> {outputs[name]} (subset: {subset})")
+                sampled = SampledLines(tar.extractfile(member), subset=subset, random_state=random_state)
+                storage.store.put_stream(outputs[name], sampled, override=True, content_type="text/csv")
+                print(f"> Uploaded {sampled.lines} lines to {outputs[name]}")
+                uploaded.add(name)
+    
+    missing = set(outputs) - uploaded
+    if missing:
+        raise Exception(f"> Files not found in the archive: {sorted(missing)}")
+
+
 def handler(params, _):
     ''' Extract the Amazon Reviews Dataset, and upload train and test data. Sample the dataset if required. 
     
     Parameters: 
     - tgz_input_object_name: (string) object name where the dataset is stored (default: 'data/test.csv')
     - subset: (float) indicating the percentage of dataset to use for training and testing 
-    - local_dataset_file: (string) local file used to store the dataset (default: './amazon_review_polarity_csv.tgz')
+    - local_dataset_file: (string) name of the local copy of the dataset, kept in the artifact cache (default: './amazon_review_polarity_csv.tgz')
     - local_output_dir: (string) local file used to extract the dataset (default: './data')
     - output_train_object_name: (string) object name used to save the training dataset on MinIO (default: 'data/train.csv')
     - output_test_object_name: (string) object name used to save the testing dataset on MinIO (default: 'data/test.csv')
+    - streaming: (bool) read the archive as a stream from MinIO and sample it while uploading, without using the local disk (default: false)
+    - seed: (int) seed used to sample the dataset (default: 42)
     '''
     
     print("Extractor")
@@ -73,23 +132,43 @@ def handler(params, _):
         subset = float(params["subset"])
     except:
         subset = 1.0
+
+    try:
+        streaming = str(params["streaming"]).lower() == "true"
+    except:
+        streaming = False
+
+    try:
+        seed = int(params["seed"])
+    except:
+        seed = 42
+
+    # Outputs are identified by the dataset they are extracted from and by the sampling parameters
+    dataset_key = artifacts.object_key(tgz_input_object_name)
+    if dataset_key is None:
+        raise Exception(f"> Dataset not found on MinIO: {tgz_input_object_name}")
+    key = artifacts.artifact_key(dataset=dataset_key, subset=subset, seed=seed, streaming=streaming)
         
-    # Check if final file already exists: 
-    if minio_client.exists(output_train_object_name):
+    # Check if final files already exist: 
+    if artifacts.is_published(output_train_object_name, key) and artifacts.is_published(output_test_object_name, key):
         print(f"> Train data already exists on MinIO: {output_train_object_name}")
         return {"status" : "already existing",
                 "train_object_name" : output_train_object_name, 
                 "test_object_name": output_test_object_name }
+
+    if streaming:
+        print(f"> Extracting '{tgz_input_object_name}' as a stream")
+        extract_streaming(tgz_input_object_name, 
+                          {"train.csv": output_train_object_name, "test.csv": output_test_object_name}, 
+                          subset=subset, random_state=seed)
+        artifacts.mark(output_train_object_name, key)
+        artifacts.mark(output_test_object_name, key)
+        return {"status" : "ok",
+                "train_object_name" : output_train_object_name, 
+                "test_object_name": output_test_object_name }
         
-    # Download dataset in tgz format
-    _local_dataset_file = Path(local_dataset_file)
-    if not _local_dataset_file.exists():
-        print(f"> Downloading dataset from MinIO: {tgz_input_object_name} -> {local_dataset_file}")
-        ret = minio_client.download_file(tgz_input_object_name, local_dataset_file)
-        if not ret: 
-            raise Exception("> Error while downloading testing data.")
-    else:
-        print(f"> Dataset alreadly existing in: {local_dataset_file}")
+    # Download dataset in tgz format (unless a copy of the same object is cached)
+    local_dataset_file = artifacts.cache.fetch(tgz_input_object_name, local_dataset_file)
     
     # Extracting file. Expected train.csv, test.csv
     print(f"> Extracting '{local_dataset_file}' to '{local_output_dir}'")
@@ -107,11 +186,11 @@ def handler(params, _):
     if subset < 1.0: 
         print(f"> Sampling data: {subset}")
         sampled_train_data = f"{local_output_dir}/{prefix}/train-{subset}.csv" 
-        sample_csv(local_train_data, sampled_train_data, subset=subset)
+        sample_csv(local_train_data, sampled_train_data, subset=subset, random_state=seed)
         print(f"> Train data updated")
         
         sampled_test_data = f"{local_output_dir}/{prefix}/test-{subset}.csv" 
-        sample_csv(local_test_data, sampled_test_data, subset=subset)
+        sample_csv(local_test_data, sampled_test_data, subset=subset, random_state=seed)
         print(f"> Test data updated")
         
         local_train_data = sampled_train_data
@@ -119,10 +198,10 @@ def handler(params, _):
     
     # Upload files
     print(f"> Uploading train data to MinIO: {local_train_data} -> {output_train_object_name}]")
-    minio_client.upload_file(local_train_data, output_train_object_name)
+    artifacts.publish(local_train_data, output_train_object_name, key)
 
     print(f"> Uploading test data to MinIO: {local_test_data} -> {output_test_object_name}]")
-    minio_client.upload_file(local_test_data, output_test_object_name)
+    artifacts.publish(local_test_data, output_test_object_name, key)
     
     return {"status" : "ok",
                 "train_object_name" : output_train_object_name, 
@@ -1,11 +1,18 @@
-import pandas as pd
 import numpy as np
+import multiprocessing
+import os
 import pickle
-from sklearn.linear_model import LogisticRegression
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics import accuracy_score
-from pathlib import Path
-import minio_client
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import artifacts
+import compact_model
+import startup
+import storage
+
+# pandas and sklearn are imported by the functions using them: predicting with a compact model needs neither,
+# which shortens the cold start of the predict and evaluate tasks
 
 TRAIN_DATA_FILE = "train.csv"
 TRAIN_OBJECT_NAME = "data/train.csv"
@@ -15,16 +22,34 @@ MODEL_FILE = 'sentiment_model.pkl'
 VECTORIZER_FILE = 'tfidf_vectorizer.pkl'
 MODEL_OBJECT_NAME = 'model/sentiment_model.pkl'
 VECTORIZER_OBJECT_NAME = 'model/tfidf_vectorizer.pkl'
+# Max. number of (model, vectorizer) pairs kept in memory
+MODEL_CACHE_SIZE = int(os.getenv("MODEL_CACHE_SIZE", "4"))
+# Format used to export trained models: compact (memory-mapped arrays) or pickle
+MODEL_FORMAT = os.getenv("MODEL_FORMAT", "compact").lower()
+# Number of CSV rows read at a time by the streaming training mode
+CHUNK_SIZE = 100_000
+# Number of processes fitting the candidates of a sweep
+SWEEP_WORKERS = int(os.getenv("SWEEP_WORKERS", str(os.cpu_count() or 1)))
+# Default grid of a sweep
+SWEEP_MAX_FEATURES = [5_000, 10_000, 20_000]
+SWEEP_C = [0.1, 1.0, 10.0]
+
+# Only the label and the review text are used
+CSV_COLUMNS = ['label', 'title', 'review']
+CSV_USECOLS = ['label', 'review']
+CSV_DTYPES = {'label': np.int8, 'review': str}
 
-def read_data_from_csv(filepath, subset = 1.0):
+def read_data_from_csv(filepath, subset = 1.0, random_state = None):
+    import pandas as pd
     try:
-        df = pd.read_csv(filepath, header=None, names=['label', 'title', 'review'], encoding='utf-8')
+        df = pd.read_csv(filepath, header=None, names=CSV_COLUMNS, usecols=CSV_USECOLS, dtype=CSV_DTYPES, 
+                         encoding='utf-8')
         
         # Convert labels: 2 -> 1 (positive) and 1 -> 0 (negative) for binary classification
-        df['sentiment'] = df['label'].apply(lambda x: 1 if x == 2 else 0)
+        df['sentiment'] = (df['label'] == 2).astype(np.int8)
         
         if subset < 1.0:
-            df = df.sample(frac=subset)
+            df = df.sample(frac=subset, random_state=random_state)
         
         # The review text is the feature, the sentiment is the target
         X = df['review']
@@ -37,12 +62,12 @@ def read_data_from_csv(filepath, subset = 1.0):
         print(f"Error: The file '{filepath}' was not found. Please provide the correct path to your CSV file.")
         return None, None
 
-def train_model(train_csv_filepath, subset = 1.0, max_features = 20000):
-    X_train, y_train = read_data_from_csv(train_csv_filepath, subset=subset)
+def train_model(train_csv_filepath, subset = 1.0, max_features = 20000, random_state = 42):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    X_train, y_train = read_data_from_csv(train_csv_filepath, subset=subset, random_state=random_state)
     if X_train is None:
         return (None, None)
-    X_train = np.array(X_train)
-    y_train = np.array(y_train)
 
     # Use TfidfVectorizer, which considers term frequency-inverse document frequency,
     # and n-grams to capture more context.
@@ -55,12 +80,149 @@ def train_model(train_csv_filepath, subset = 1.0, max_features = 20000):
     
     return (model, vectorizer)
 
+def train_model_streaming(train_csv_filepath, subset = 1.0, max_features = 20000, chunksize = CHUNK_SIZE, random_state = 42):
+    ''' Train the model reading the CSV in chunks, so that memory usage does not depend on the dataset size. 
+    
+    Rows are sampled while reading (each row is kept with probability `subset`). Since the vocabulary 
+    cannot be known in advance, reviews are vectorized with a HashingVectorizer of `max_features` 
+    features, and a logistic regression is fitted incrementally with SGDClassifier.partial_fit. 
+    '''
+    import pandas as pd
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.linear_model import SGDClassifier
+    vectorizer = HashingVectorizer(ngram_range=(1, 2), n_features=max_features, alternate_sign=False, norm='l2')
+    model = SGDClassifier(loss='log_loss', random_state=random_state)
+    rng = np.random.default_rng(random_state)
+    classes = np.array([0, 1])
+    
+    try:
+        chunks = pd.read_csv(train_csv_filepath, header=None, names=CSV_COLUMNS, usecols=CSV_USECOLS, 
+                             dtype=CSV_DTYPES, encoding='utf-8', chunksize=chunksize)
+        rows = 0
+        for chunk in chunks:
+            if subset < 1.0:
+                chunk = chunk[rng.random(len(chunk)) < subset]
+            if len(chunk) == 0:
+                continue
+            
+            X_vec = vectorizer.transform(chunk['review'].fillna(''))
+            y = (chunk['label'].to_numpy() == 2).astype(np.int8)
+            model.partial_fit(X_vec, y, classes=classes)
+            rows += len(chunk)
+    
+    except FileNotFoundError:
+        print(f"Error: The file '{train_csv_filepath}' was not found. Please provide the correct path to your CSV file.")
+        return (None, None)
+    
+    print(f"> Successfully trained on {rows} reviews from '{train_csv_filepath}'.")
+    if rows == 0:
+        return (None, None)
+    return (model, vectorizer)
+
+def count_ngrams(X_train, X_test):
+    ''' Tokenize the reviews and count their n-grams once. 
+    
+    Returns the count matrices of train and test set (as CSC matrices), with columns sorted by decreasing 
+    frequency in the train set: the first `max_features` columns are the terms that a TfidfVectorizer 
+    with `max_features` would keep. 
+    '''
+    from sklearn.feature_extraction.text import CountVectorizer
+    counter = CountVectorizer(ngram_range=(1, 2))
+    counts_train = counter.fit_transform(X_train)
+    counts_test = counter.transform(X_test)
+    
+    frequencies = np.asarray(counts_train.sum(axis=0)).ravel()
+    order = np.argsort(-frequencies, kind='stable')
+    print(f"> Counted {len(order)} n-grams in {counts_train.shape[0]} reviews")
+    return counts_train[:, order].tocsc(), counts_test[:, order].tocsc()
+
+# Data of the running sweep: mapped by the worker processes, or set in this process when fitting sequentially
+_sweep_data = None
+_sweep_lock = threading.Lock()
+
+def _save_sweep_data(path, counts_train, y_train, counts_test, y_test):
+    ''' Write the count matrices and labels of a sweep to a file in the compact format '''
+    arrays = {"y_train": y_train, "y_test": y_test}
+    for name, X in (("train", counts_train), ("test", counts_test)):
+        arrays.update({f"{name}_data": X.data, f"{name}_indices": X.indices, f"{name}_indptr": X.indptr})
+    meta = {"train_shape": list(counts_train.shape), "test_shape": list(counts_test.shape)}
+    compact_model.write_arrays(path, meta, arrays)
+
+def _load_sweep_data(path):
+    ''' Initializer of the worker processes: map the data written by `_save_sweep_data`, shared through the page cache '''
+    from scipy.sparse import csc_matrix
+    global _sweep_data
+    meta, a = compact_model.read_arrays(path)
+    matrices = {name: csc_matrix((a[f"{name}_data"], a[f"{name}_indices"], a[f"{name}_indptr"]),
+                                 shape=tuple(meta[f"{name}_shape"]), copy=False)
+                for name in ("train", "test")}
+    _sweep_data = (matrices["train"], a["y_train"], matrices["test"], a["y_test"])
+
+def _fit_candidate(max_features, C):
+    ''' Fit the model of a configuration of the sweep on the shared counts, and return its accuracy '''
+    from sklearn.feature_extraction.text import TfidfTransformer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import accuracy_score
+    counts_train, y_train, counts_test, y_test = _sweep_data
+    
+    # TF-IDF of the `max_features` most frequent terms
+    tfidf = TfidfTransformer()
+    X_train_vec = tfidf.fit_transform(counts_train[:, :max_features].tocsr())
+    model = LogisticRegression(solver='liblinear', C=C)
+    model.fit(X_train_vec, y_train)
+    
+    X_test_vec = tfidf.transform(counts_test[:, :max_features].tocsr())
+    return accuracy_score(y_test, model.predict(X_test_vec))
+
+def train_sweep(train_csv_filepath, test_csv_filepath, max_features_grid, c_grid, subset=1.0, random_state=42, 
+                workers=SWEEP_WORKERS):
+    ''' Train and evaluate a model for each combination of `max_features` and `C`. 
+    
+    The reviews are tokenized once; the candidates are fitted in parallel on `workers` processes. 
+    Returns a list of (max_features, C, accuracy). 
+    '''
+    global _sweep_data
+    
+    X_train, y_train = read_data_from_csv(train_csv_filepath, subset=subset, random_state=random_state)
+    X_test, y_test = read_data_from_csv(test_csv_filepath, subset=subset, random_state=random_state)
+    if X_train is None or X_test is None:
+        return None
+    
+    counts_train, counts_test = count_ngrams(X_train.fillna(''), X_test.fillna(''))
+    grid = [(max_features, C) for max_features in max_features_grid for C in c_grid]
+    
+    if workers > 1 and len(grid) > 1:
+        # Workers are not forked from this (multi-threaded) process, where other requests may hold locks: they
+        # are started by a fork server, and map the count matrices from a file rather than receiving pickled copies
+        fd, path = tempfile.mkstemp(suffix=".bin")
+        os.close(fd)
+        try:
+            _save_sweep_data(path, counts_train, y_train.to_numpy(), counts_test, y_test.to_numpy())
+            with ProcessPoolExecutor(max_workers=min(workers, len(grid)), 
+                                     mp_context=multiprocessing.get_context("forkserver"),
+                                     initializer=_load_sweep_data, initargs=(path,)) as pool:
+                futures = [pool.submit(_fit_candidate, max_features, C) for max_features, C in grid]
+                accuracies = [f.result() for f in futures]
+        finally:
+            os.remove(path)
+    else:
+        with _sweep_lock:
+            _sweep_data = (counts_train, y_train.to_numpy(), counts_test, y_test.to_numpy())
+            try:
+                accuracies = [_fit_candidate(max_features, C) for max_features, C in grid]
+            finally:
+                _sweep_data = None
+    
+    results = [(max_features, C, float(accuracy)) for (max_features, C), accuracy in zip(grid, accuracies)]
+    for max_features, C, accuracy in results:
+        print(f"> max_features={max_features}, C={C}: accuracy {accuracy:.4f}")
+    return results
+
 def evaluate_model(test_csv_filepath, vectorizer, model, subset=1.0):
+    from sklearn.metrics import accuracy_score
     X_test, y_test = read_data_from_csv(test_csv_filepath, subset=subset)
     if X_test is None:
         return 0
-    X_test = np.array(X_test)
-    y_test = np.array(y_test)
 
     # Evaluate accuracy on test set
     X_test_vec = vectorizer.transform(X_test)
@@ -70,8 +232,20 @@ def evaluate_model(test_csv_filepath, vectorizer, model, subset=1.0):
     return accuracy
 
 
-def save_model(model, vectorizer, model_filepath, vectorizer_filepath):
-    # Save the trained model and the vectorizer to files
+def save_model(model, vectorizer, model_filepath, vectorizer_filepath, model_format=MODEL_FORMAT):
+    ''' Save the trained model and the vectorizer to files. 
+    
+    In the compact format, the vocabulary is stored as a sorted array of terms, and the IDF and the coefficients 
+    as raw arrays, which are memory-mapped when loading. Models that cannot be exported in this format 
+    (e.g., the ones trained in streaming mode) are pickled. 
+    '''
+    if model_format == "compact" and compact_model.can_save_vectorizer(vectorizer) and compact_model.can_save_model(model):
+        columns = compact_model.save_vectorizer(vectorizer, vectorizer_filepath)
+        print(f"> Vectorizer saved to '{vectorizer_filepath}' (compact)")
+        compact_model.save_model(model, model_filepath, columns)
+        print(f"> Model saved to '{model_filepath}' (compact)")
+        return
+    
     with open(model_filepath, 'wb') as f:
         pickle.dump(model, f)
     print(f"> Model saved to '{model_filepath}'")
@@ -82,6 +256,13 @@ def save_model(model, vectorizer, model_filepath, vectorizer_filepath):
 
 def load_model_and_vectorizer(model_filepath, vectorizer_filepath):
     try:
+        # Files in the compact format are memory-mapped; otherwise, they are unpickled
+        if compact_model.is_compact(model_filepath) and compact_model.is_compact(vectorizer_filepath):
+            model = compact_model.load_model(model_filepath)
+            vectorizer = compact_model.load_vectorizer(vectorizer_filepath)
+            print("> Model and Vectorizer loaded successfully (compact).")
+            return model, vectorizer
+        
         with open(model_filepath, 'rb') as f:
             model = pickle.load(f)
         
@@ -95,18 +276,90 @@ def load_model_and_vectorizer(model_filepath, vectorizer_filepath):
         print(f"Error: One of the files ('{model_filepath}' or '{vectorizer_filepath}') was not found. Please train and save the model first.")
         return None, None
 
+class ModelRegistry:
+    ''' In-process cache of loaded (model, vectorizer) pairs, keyed by their object names. 
+    
+    Every lookup revalidates the cached pair with a stat of both objects: if an ETag changed, 
+    the pair is downloaded and loaded again. The least recently used pairs are evicted 
+    beyond `capacity` entries. 
+    '''
+
+    def __init__(self, capacity=MODEL_CACHE_SIZE):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_object, vectorizer_object, local_model_file=MODEL_FILE, local_vectorizer_file=VECTORIZER_FILE):
+        model_stat = storage.store.stat(model_object)
+        vectorizer_stat = storage.store.stat(vectorizer_object)
+        if model_stat is None or vectorizer_stat is None:
+            raise Exception(f"> Model not found: [{model_object}, {vectorizer_object}]")
+        
+        key = (model_object, vectorizer_object)
+        etags = (model_stat["etag"], vectorizer_stat["etag"])
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == etags:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                print(f"> Using cached model and vectorizer: [{model_object}, {vectorizer_object}]")
+                return entry[1], entry[2]
+            self.misses += 1
+
+        # Each version of the objects has its own local copy in the artifact cache, so that files 
+        # memory-mapped by a cached entry are never overwritten
+        local_model_file = artifacts.cache.fetch(model_object, local_model_file)
+        local_vectorizer_file = artifacts.cache.fetch(vectorizer_object, local_vectorizer_file)
+
+        print(f"> Loading model and vectorizer: [{local_model_file}, {local_vectorizer_file}]")
+        with startup.phase("model_load"):
+            model, vectorizer = load_model_and_vectorizer(local_model_file, local_vectorizer_file)
+        if model is None:
+            raise Exception("> Error while loading model and vectorizer.")
+
+        with self.lock:
+            self.entries[key] = (etags, model, vectorizer)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return model, vectorizer
+
+    def get_stats(self):
+        with self.lock:
+            return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+# Models loaded by this process
+registry = ModelRegistry()
+
+
+def predict_sentiments(reviews, vectorizer, model):
+    ''' Predict the sentiment of a batch of reviews. 
+    
+    The reviews are vectorized as a single sparse matrix, and labels are derived from 
+    a single call to `predict_proba`. Returns the labels and the probabilities of the 
+    positive and negative classes. 
+    '''
+    reviews_vec = vectorizer.transform(reviews)
+    proba = model.predict_proba(reviews_vec)
+    
+    classes = list(model.classes_)
+    proba_positive = proba[:, classes.index(1)]
+    proba_negative = proba[:, classes.index(0)]
+    labels = np.where(model.classes_[proba.argmax(axis=1)] == 1, "Positive", "Negative")
+    
+    return labels.tolist(), proba_positive.tolist(), proba_negative.tolist()
+
 def predict_sentiment(review, vectorizer, model):
     try:
-        review_vec = vectorizer.transform([review])
-        
-        predicted_sentiment = model.predict(review_vec)[0]
-        predicted_proba = model.predict_proba(review_vec)[0]
-        sentiment_label = "Positive" if predicted_sentiment == 1 else "Negative"
+        labels, proba_positive, proba_negative = predict_sentiments([review], vectorizer, model)
         
         return {
-            "sentiment": sentiment_label,
-            "confidence_positive": predicted_proba[1],
-            "confidence_negative": predicted_proba[0]
+            "sentiment": labels[0],
+            "confidence_positive": proba_positive[0],
+            "confidence_negative": proba_negative[0]
         }
         
     except Exception as e:
@@ -120,13 +373,16 @@ def handler_train(params, _):
     
     Parameters (all optional): 
     - train_object_data: (string) object name where the train set is stored (default: 'data/train.csv')
-    - local_train_file: (string) local file used to store the train data (default: 'train.csv')
+    - local_train_file: (string) name of the local copy of the train data, kept in the artifact cache (default: 'train.csv')
     - subset: (float) indicating the percentage of dataset to use for training the model 
     - max_features: (int) indicating the maximum number of features to use for the model 
     - local_model_file: (string) local file used to store the model before uploading it to MinIO (default: 'sentiment_model.pkl')
     - local_vectorizer_file: (string) local file used to store the vectorizer before uploading it to MinIO (default: 'tfidf_vectorizer.pkl')
     - output_model_object: (string) object name used to export the model on MinIO (default: 'model/sentiment_model.pkl')
     - output_vectorizer_object: (string) object name used to export the vectorizer on MinIO (default: 'model/tfidf_vectorizer.pkl')
+    - streaming: (bool) read the train set in chunks and train an out-of-core model, with bounded memory usage (default: false)
+    - chunksize: (int) number of rows read at a time in streaming mode (default: 100000)
+    - seed: (int) seed used to sample the train set (default: 42)
     '''
 
     print("Training Sentiment Analysis model on the Amazon Review Dataset")
@@ -169,43 +425,148 @@ def handler_train(params, _):
         local_train_file = params["local_train_file"]
     except:
         local_train_file = TRAIN_DATA_FILE
+
+    try:
+        streaming = str(params["streaming"]).lower() == "true"
+    except:
+        streaming = False
+
+    try:
+        chunksize = int(params["chunksize"])
+    except:
+        chunksize = CHUNK_SIZE
+
+    try:
+        seed = int(params["seed"])
+    except:
+        seed = 42
+
+    # The model is identified by the train data and by all the training parameters
+    train_data_key = artifacts.object_key(train_object_data)
+    if train_data_key is None:
+        raise Exception(f"Training data not found on MinIO: {train_object_data}")
+    key = artifacts.artifact_key(data=train_data_key, subset=subset, max_features=max_features, seed=seed,
+                                 streaming=streaming, chunksize=chunksize if streaming else None, 
+                                 model_format=MODEL_FORMAT)
     
-    if minio_client.exists(output_model_object):
+    if artifacts.is_published(output_model_object, key) and artifacts.is_published(output_vectorizer_object, key):
         print("> Model already exists!")
         return {"status" : "already existing",
                 "model_object_name" : output_model_object, 
                 "vectorizer_object_name": output_vectorizer_object }
         
-    _local_train_file = Path(local_train_file)
-    if not _local_train_file.exists():
-        print("> Downloading training data from MinIO")   
-        ret = minio_client.download_file(train_object_data, local_train_file)
-        if not ret: 
-            raise Exception("Error while downloading training data.")
-    else:
-        print(f"> Training data already existing in: {local_train_file}")
+    # Download training data (unless a copy of the same object is cached)
+    local_train_file = artifacts.cache.fetch(train_object_data, local_train_file)
     
-    print(f"> Training model with parameters: subset={subset}, max_features={max_features} ")
-    (model, vectorizer) = train_model(local_train_file, subset=subset, max_features=max_features)
+    if streaming:
+        print(f"> Training model in streaming mode with parameters: subset={subset}, max_features={max_features}, chunksize={chunksize} ")
+        (model, vectorizer) = train_model_streaming(local_train_file, subset=subset, max_features=max_features, chunksize=chunksize, random_state=seed)
+    else:
+        print(f"> Training model with parameters: subset={subset}, max_features={max_features} ")
+        (model, vectorizer) = train_model(local_train_file, subset=subset, max_features=max_features, random_state=seed)
+    if model is None:
+        raise Exception("> Error while training the model.")
     
     print(f"> Saving model locally: [{local_model_file}; {local_vectorizer_file}] ")
     save_model(model=model, vectorizer=vectorizer, model_filepath = local_model_file, vectorizer_filepath=local_vectorizer_file)
 
     print(f"> Uploading model to MinIO: [{output_model_object}, {output_vectorizer_object}]")
-    minio_client.upload_file(local_model_file, output_model_object)
-    minio_client.upload_file(local_vectorizer_file, output_vectorizer_object)
+    artifacts.publish(local_model_file, output_model_object, key)
+    artifacts.publish(local_vectorizer_file, output_vectorizer_object, key)
     
     return {"status" : "ok",
             "model_object_name" : output_model_object,
             "vectorizer_object_name": output_vectorizer_object }
         
         
+def parse_grid(value, cast):
+    ''' Values of a sweep parameter, given as a list or as a comma-separated string '''
+    if isinstance(value, str):
+        value = value.split(",")
+    elif not isinstance(value, (list, tuple)):
+        value = [value]
+    return [cast(v) for v in value]
+
+def handler_train_sweep(params, _):
+    ''' Train and evaluate a Sentiment Analysis model for each point of a grid of hyperparameters
+    
+    Parameters (all optional): 
+    - train_object_data: (string) object name where the train set is stored (default: 'data/train.csv')
+    - local_train_file: (string) name of the local copy of the train data, kept in the artifact cache (default: 'train.csv')
+    - test_object_data: (string) object name where the test set is stored (default: 'data/test.csv')
+    - local_test_file: (string) name of the local copy of the test data, kept in the artifact cache (default: 'test.csv')
+    - subset: (float) indicating the percentage of dataset to use for training and testing the models 
+    - max_features_grid: (list of int) values of max_features to try (default: [5000, 10000, 20000])
+    - c_grid: (list of float) values of the inverse regularization strength C to try (default: [0.1, 1.0, 10.0])
+    - seed: (int) seed used to sample the datasets (default: 42)
+    '''
+
+    print("Hyperparameter sweep of the Sentiment Analysis model on the Amazon Review Dataset")
+    try:
+        subset = float(params["subset"])
+    except:
+        subset = 1.0
+
+    try:
+        max_features_grid = parse_grid(params["max_features_grid"], int)
+    except:
+        max_features_grid = SWEEP_MAX_FEATURES
+
+    try:
+        c_grid = parse_grid(params["c_grid"], float)
+    except:
+        c_grid = SWEEP_C
+
+    try:
+        train_object_data = params["train_object_data"]
+    except:
+        train_object_data = TRAIN_OBJECT_NAME
+    
+    try:
+        local_train_file = params["local_train_file"]
+    except:
+        local_train_file = TRAIN_DATA_FILE
+        
+    try:
+        test_object_data = params["test_object_data"]
+    except:
+        test_object_data = TEST_OBJECT_NAME
+        
+    try:
+        local_test_file = params["local_test_file"]
+    except:
+        local_test_file = TEST_DATA_FILE
+
+    try:
+        seed = int(params["seed"])
+    except:
+        seed = 42
+
+    # Download train and test data (unless a copy of the same object is cached)
+    local_train_file = artifacts.cache.fetch(train_object_data, local_train_file)
+    local_test_file = artifacts.cache.fetch(test_object_data, local_test_file)
+    
+    print(f"> Sweeping max_features={max_features_grid}, C={c_grid} (subset={subset}, workers={SWEEP_WORKERS})")
+    results = train_sweep(local_train_file, local_test_file, max_features_grid, c_grid, subset=subset, random_state=seed)
+    if not results:
+        raise Exception("> Error while training the models.")
+    
+    best = max(results, key=lambda r: r[2])
+    return {"status" : "ok",
+            "max_features" : [r[0] for r in results],
+            "C" : [r[1] for r in results],
+            "accuracy" : [r[2] for r in results],
+            "best_max_features" : best[0],
+            "best_C" : best[1],
+            "best_accuracy" : best[2] }
+
+
 def handler_evaluate(params, _):
     ''' Evaluate a Sentiment Analysis using Amazon Reviews
     
     Parameters: 
     - test_object_data: (string) object name where the test set is stored (default: 'data/test.csv')
-    - local_test_file: (string) local file used to store the test data (default: 'test.csv')
+    - local_test_file: (string) name of the local copy of the test data, kept in the artifact cache (default: 'test.csv')
     - subset: (float) indicating the percentage of dataset to use for training the model 
     - local_model_file: (string) local file used to store the model before uploading it to MinIO (default: 'sentiment_model.pkl')
     - local_vectorizer_file: (string) local file used to store the vectorizer before uploading it to MinIO (default: 'tfidf_vectorizer.pkl')
@@ -244,30 +605,10 @@ def handler_evaluate(params, _):
     except:
         local_test_file = TEST_DATA_FILE
 
-    _local_test_file = Path(local_test_file)
-    if not _local_test_file.exists():
-        print(f"> Downloading testing data: {test_object_data} -> {local_test_file}")
-        ret = minio_client.download_file(test_object_data, local_test_file)
-        if not ret: 
-            raise Exception("> Error while downloading testing data.")
-    else:
-        print(f"> Test data alreadly existing in: {local_test_file}")
-    
-    _local_model_files = Path(local_model_file)
-    if not _local_model_files.exists():
-        print(f"> Downloading model from MinIO: [{model_object}, {vectorizer_object}]")
-        ret = minio_client.download_file(model_object, local_model_file)
-        if not ret: 
-            raise Exception("> Error while downloading model object.")
-        
-        ret = minio_client.download_file(vectorizer_object, local_vectorizer_file)
-        if not ret: 
-            raise Exception("> Error while downloading vectorizer object.")
-    else:
-        print(f"> Skipping model download from MinIO, as it already exists locally")
-        
-    print(f"> Loading model and vectorizer: [{local_model_file}, {local_vectorizer_file}]")
-    model, vectorizer = load_model_and_vectorizer(local_model_file, local_vectorizer_file)
+    # Download testing data (unless a copy of the same object is cached)
+    local_test_file = artifacts.cache.fetch(test_object_data, local_test_file)
+    
+    model, vectorizer = registry.get(model_object, vectorizer_object, local_model_file, local_vectorizer_file)
 
     try:
         subset = float(params["subset"])
@@ -278,4 +619,52 @@ def handler_evaluate(params, _):
     accuracy = evaluate_model(local_test_file, vectorizer, model, subset=subset)
 
     return {"status" : "ok", 
-            "accuracy" : accuracy }
\ No newline at end of file
+            "accuracy" : accuracy }
+
+
+def handler_predict(params, _):
+    ''' Predict the sentiment of a batch of reviews
+    
+    Parameters: 
+    - reviews: (list of strings) reviews to classify (a single string is also accepted)
+    - local_model_file: (string) local file used to store the model downloaded from MinIO (default: 'sentiment_model.pkl')
+    - local_vectorizer_file: (string) local file used to store the vectorizer downloaded from MinIO (default: 'tfidf_vectorizer.pkl')
+    - input_model_object: (string) object name used to import the model from MinIO (default: 'model/sentiment_model.pkl')
+    - input_vectorizer_object: (string) object name used to import the vectorizer from MinIO (default: 'model/tfidf_vectorizer.pkl')
+    '''
+    
+    try:
+        reviews = params["reviews"]
+    except:
+        raise Exception("> Missing parameter: reviews")
+    if isinstance(reviews, str):
+        reviews = [reviews]
+
+    try:
+        model_object = params["input_model_object"]
+    except:
+        model_object = MODEL_OBJECT_NAME
+            
+    try:
+        vectorizer_object = params["input_vectorizer_object"]
+    except:
+        vectorizer_object = VECTORIZER_OBJECT_NAME
+        
+    try:
+        local_model_file = params["local_model_file"]
+    except:
+        local_model_file = MODEL_FILE
+        
+    try:
+        local_vectorizer_file = params["local_vectorizer_file"]
+    except:
+        local_vectorizer_file = VECTORIZER_FILE
+
+    model, vectorizer = registry.get(model_object, vectorizer_object, local_model_file, local_vectorizer_file)
+    
+    labels, proba_positive, proba_negative = predict_sentiments(reviews, vectorizer, model)
+
+    return {"status" : "ok", 
+            "sentiments" : labels,
+            "confidence_positive" : proba_positive,
+            "confidence_negative" : proba_negative }
@@ -1,40 +1,80 @@
+import os
 import requests
-import minio_client
-from pathlib import Path
+import artifacts
+from concurrent.futures import ThreadPoolExecutor
 
-def retrieve(url, output):
-    print(f" [Retrieval] Downloading dataset from {url}...")
-    r = requests.get(url, stream=True)
-    r.raise_for_status()
-        
-    output_file = Path(output)
-    if not output_file.exists():    
+# Size of the byte ranges downloaded concurrently
+DOWNLOAD_PART_SIZE   = int(os.getenv("DOWNLOAD_PART_SIZE", str(16 * 1024 * 1024)))
+# Number of ranges downloaded at the same time (1: single stream)
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "4"))
+# Size of the buffers used to write downloaded data
+BUFFER_SIZE = 1024 * 1024
+
+def download_part(url, output, offset, length):
+    headers = {"Range": f"bytes={offset}-{offset + length - 1}"}
+    with requests.get(url, headers=headers, stream=True) as r:
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise Exception(f"Range requests not supported by {url}")
+        with open(output, "r+b") as f:
+            f.seek(offset)
+            for chunk in r.iter_content(chunk_size=BUFFER_SIZE):
+                f.write(chunk)
+
+def download_ranges(url, output, size, part_size=DOWNLOAD_PART_SIZE, concurrency=DOWNLOAD_CONCURRENCY):
+    tmp_output = f"{output}.part"
+    with open(tmp_output, "wb") as f:
+        f.truncate(size)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        parts = [pool.submit(download_part, url, tmp_output, offset, min(part_size, size - offset))
+                 for offset in range(0, size, part_size)]
+        for part in parts:
+            part.result()
+    os.replace(tmp_output, output)
+
+def download_stream(url, output):
+    with requests.get(url, stream=True) as r:
+        r.raise_for_status()
         with open(output, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
+            for chunk in r.iter_content(chunk_size=BUFFER_SIZE):
                 f.write(chunk)
-        print(f" [Retrieval] Saved dataset to {output}")
-        return True
+
+def retrieve(url, output):
+    print(f" [Retrieval] Downloading dataset from {url}...")
+    head = requests.head(url, allow_redirects=True)
+    head.raise_for_status()
+    size = int(head.headers.get("Content-Length", 0))
+    accepts_ranges = head.headers.get("Accept-Ranges", "").lower() == "bytes"
+
+    if DOWNLOAD_CONCURRENCY > 1 and accepts_ranges and size > DOWNLOAD_PART_SIZE:
+        print(f" [Retrieval] Downloading {size} bytes as {DOWNLOAD_PART_SIZE}-byte ranges ({DOWNLOAD_CONCURRENCY} at a time)")
+        download_ranges(head.url, output, size)
     else:
-        print(f" [Retrieval] Dataset not downloaded as it already exists in {output}")
-        return False
+        download_stream(url, output)
+    print(f" [Retrieval] Saved dataset to {output}")
         
-def upload_to_minio(input, object_name):
+def upload_to_minio(input, object_name, key):
     print(f" [Retrieval] Uploading file to MinIO {object_name}...")
-    if minio_client.exists(object_name=object_name):
-        print(f" [Retrieval] Upload not performed, object {object_name} already exists")
-        return False
-    else:
-        minio_client.upload_file(input, object_name, override=False)
+    artifacts.publish(input, object_name, key)
     return True
 
 def handler(data_url, local_temp_path, object_name):
+    # The dataset is identified by its URL
+    key = artifacts.artifact_key(url=data_url)
     
-    if minio_client.exists(object_name):
+    if artifacts.is_published(object_name, key):
         print("> Dataset already existing on MinIO. Retriever completes.")
         return {"status" : "already existing", 
                 "local_download": False, "uploaded": False,
                 "object_name" : object_name}
-        
-    downlaoded = retrieve(data_url, output=local_temp_path)
-    uploaded = upload_to_minio(local_temp_path, object_name=object_name)
-    return {"status": "ok", "local_download": downlaoded, "uploaded": uploaded, "object": object_name}
+    
+    local_path = artifacts.cache.lookup(key, local_temp_path)
+    downloaded = local_path is None
+    if downloaded:
+        retrieve(data_url, output=local_temp_path)
+        local_path = artifacts.cache.add(key, local_temp_path, local_temp_path)
+    else:
+        print(f" [Retrieval] Dataset not downloaded as it is already cached in {local_path}")
+    
+    uploaded = upload_to_minio(local_path, object_name, key)
+    return {"status": "ok", "local_download": downloaded, "uploaded": uploaded, "object": object_name}
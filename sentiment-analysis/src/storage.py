@@ -0,0 +1,318 @@
+import abc
+import contextlib
+import hashlib
+import io
+import os
+import shutil
+import threading
+import time
+
+# Backend used to store objects: minio, local or memory
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "minio").lower()
+# Root directory of the local backend
+STORAGE_DIR     = os.getenv("STORAGE_DIR", "/tmp/storage")
+
+
+class ObjectStore(abc.ABC):
+    """
+    Interface of the object stores used by the functions.
+
+    Every backend records the number of calls, bytes and time spent for each
+    operation, so that storage cost can be compared across backends.
+    """
+    name = None
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+
+    def _record(self, op, nbytes, start):
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            s = self._stats.setdefault(op, {"calls": 0, "bytes": 0, "seconds": 0.0})
+            s["calls"] += 1
+            s["bytes"] += nbytes
+            s["seconds"] += elapsed
+
+    def get_stats(self):
+        with self._stats_lock:
+            return {"backend": self.name, "ops": {op: dict(s) for op, s in self._stats.items()}}
+
+    def exists(self, object_name):
+        return self.stat(object_name) is not None
+
+    @abc.abstractmethod
+    def get(self, object_name):
+        """Return the content of an object as bytes"""
+
+    @abc.abstractmethod
+    def put(self, object_name, data, override=True, content_type="application/octet-stream"):
+        """Store bytes. Returns False if the object exists and override is not set"""
+
+    @abc.abstractmethod
+    def stat(self, object_name):
+        """Return {"size": ..., "etag": ...} for an object, or None if it does not exist"""
+
+    @abc.abstractmethod
+    def stream(self, object_name):
+        """Context manager returning a readable file object for an object"""
+
+    @abc.abstractmethod
+    def put_stream(self, object_name, stream, override=True, content_type="application/octet-stream"):
+        """Store the content of a readable stream. Returns False if the object exists and override is not set"""
+
+    @abc.abstractmethod
+    def get_file(self, object_name, local_path):
+        """Copy an object to a local file. Returns False on error"""
+
+    @abc.abstractmethod
+    def put_file(self, local_path, object_name, override=True):
+        """Store a local file. Returns False if the object exists and override is not set"""
+
+
+class _CountingReader:
+    """Wraps a readable stream, counting the bytes read from it"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.nbytes = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.nbytes += len(data)
+        return data
+
+
+class MinioStore(ObjectStore):
+    """Objects stored in a MinIO bucket"""
+    name = "minio"
+
+    def __init__(self, bucket_name=None):
+        super().__init__()
+        import minio_client as minioclient
+        self.client = minioclient
+        self.bucket_name = bucket_name or minioclient.MINIO_BUCKET
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats["saved_round_trips"] = self.client.get_stats()
+        return stats
+
+    def get(self, object_name):
+        start = time.perf_counter()
+        data = self.client.download_bytes(object_name, self.bucket_name)
+        self._record("get", len(data), start)
+        return data
+
+    def put(self, object_name, data, override=True, content_type="application/octet-stream"):
+        start = time.perf_counter()
+        ret = self.client.upload_bytes(data, object_name, self.bucket_name, override=override,
+                                       content_type=content_type)
+        self._record("put", len(data) if ret else 0, start)
+        return ret
+
+    def stat(self, object_name):
+        start = time.perf_counter()
+        st = self.client.stat(object_name, self.bucket_name)
+        self._record("stat", 0, start)
+        if st is None:
+            return None
+        return {"size": st.size, "etag": st.etag}
+
+    def put_stream(self, object_name, stream, override=True, content_type="application/octet-stream"):
+        start = time.perf_counter()
+        stream = _CountingReader(stream)
+        ret = self.client.upload_stream(stream, object_name, self.bucket_name, override=override,
+                                        content_type=content_type)
+        self._record("put", stream.nbytes, start)
+        return ret
+
+    @contextlib.contextmanager
+    def stream(self, object_name):
+        start = time.perf_counter()
+        response = self.client.client.get_object(self.bucket_name, object_name)
+        self._record("stream", 0, start)
+        try:
+            yield response
+        finally:
+            response.close()
+            response.release_conn()
+
+    def get_file(self, object_name, local_path):
+        start = time.perf_counter()
+        ret = self.client.download_file(object_name, local_path, self.bucket_name)
+        self._record("get", os.path.getsize(local_path) if ret else 0, start)
+        return ret
+
+    def put_file(self, local_path, object_name, override=True):
+        start = time.perf_counter()
+        ret = self.client.upload_file(local_path, object_name, self.bucket_name, override=override)
+        self._record("put", os.path.getsize(local_path) if ret else 0, start)
+        return ret
+
+
+class LocalStore(ObjectStore):
+    """Objects stored as files below a local directory (e.g., a tmpfs shared by colocated stages)"""
+    name = "local"
+
+    def __init__(self, root=STORAGE_DIR):
+        super().__init__()
+        self.root = root
+        self._real_root = os.path.realpath(root)
+
+    def _path(self, object_name):
+        # Object names are relative to the root: names resolving outside it (e.g., with "..") are rejected
+        root = self._real_root
+        path = os.path.realpath(os.path.join(root, object_name))
+        if path == root or os.path.commonpath([root, path]) != root:
+            raise Exception(f"Object {object_name} is not in {self.root}")
+        return path
+
+    def _write(self, object_name, write):
+        # Write to a temporary file first, so that readers never see partial objects
+        path = self._path(object_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def get(self, object_name):
+        start = time.perf_counter()
+        with open(self._path(object_name), "rb") as f:
+            data = f.read()
+        self._record("get", len(data), start)
+        return data
+
+    def put(self, object_name, data, override=True, content_type="application/octet-stream"):
+        start = time.perf_counter()
+        if not override and os.path.exists(self._path(object_name)):
+            self._record("put", 0, start)
+            return False
+        def write(path):
+            with open(path, "wb") as f:
+                f.write(data)
+        self._write(object_name, write)
+        self._record("put", len(data), start)
+        return True
+
+    def stat(self, object_name):
+        start = time.perf_counter()
+        try:
+            st = os.stat(self._path(object_name))
+        except FileNotFoundError:
+            st = None
+        self._record("stat", 0, start)
+        if st is None:
+            return None
+        return {"size": st.st_size, "etag": f"{st.st_mtime_ns:x}-{st.st_size:x}"}
+
+    def put_stream(self, object_name, stream, override=True, content_type="application/octet-stream"):
+        start = time.perf_counter()
+        if not override and os.path.exists(self._path(object_name)):
+            self._record("put", 0, start)
+            return False
+        stream = _CountingReader(stream)
+        def write(path):
+            with open(path, "wb") as f:
+                shutil.copyfileobj(stream, f)
+        self._write(object_name, write)
+        self._record("put", stream.nbytes, start)
+        return True
+
+    @contextlib.contextmanager
+    def stream(self, object_name):
+        start = time.perf_counter()
+        f = open(self._path(object_name), "rb")
+        self._record("stream", 0, start)
+        try:
+            yield f
+        finally:
+            f.close()
+
+    def get_file(self, object_name, local_path):
+        start = time.perf_counter()
+        try:
+            shutil.copyfile(self._path(object_name), local_path)
+        except Exception as e:
+            print(f"Error while reading file from local storage: {str(e)}")
+            return False
+        self._record("get", os.path.getsize(local_path), start)
+        return True
+
+    def put_file(self, local_path, object_name, override=True):
+        start = time.perf_counter()
+        if not override and os.path.exists(self._path(object_name)):
+            self._record("put", 0, start)
+            return False
+        self._write(object_name, lambda path: shutil.copyfile(local_path, path))
+        self._record("put", os.path.getsize(local_path), start)
+        return True
+
+
+class MemoryStore(ObjectStore):
+    """Objects kept in the memory of this process (for tests and benchmarks)"""
+    name = "memory"
+
+    def __init__(self):
+        super().__init__()
+        self.objects = {}
+
+    def get(self, object_name):
+        start = time.perf_counter()
+        data = self.objects[object_name][0]
+        self._record("get", len(data), start)
+        return data
+
+    def put(self, object_name, data, override=True, content_type="application/octet-stream"):
+        start = time.perf_counter()
+        if not override and object_name in self.objects:
+            self._record("put", 0, start)
+            return False
+        data = bytes(data)
+        self.objects[object_name] = (data, hashlib.md5(data).hexdigest())
+        self._record("put", len(data), start)
+        return True
+
+    def stat(self, object_name):
+        start = time.perf_counter()
+        obj = self.objects.get(object_name)
+        self._record("stat", 0, start)
+        if obj is None:
+            return None
+        return {"size": len(obj[0]), "etag": obj[1]}
+
+    def put_stream(self, object_name, stream, override=True, content_type="application/octet-stream"):
+        return self.put(object_name, stream.read(), override=override, content_type=content_type)
+
+    @contextlib.contextmanager
+    def stream(self, object_name):
+        yield io.BytesIO(self.get(object_name))
+
+    def get_file(self, object_name, local_path):
+        try:
+            data = self.get(object_name)
+        except KeyError:
+            print(f"Error while reading object from memory: {object_name} not found")
+            return False
+        with open(local_path, "wb") as f:
+            f.write(data)
+        return True
+
+    def put_file(self, local_path, object_name, override=True):
+        with open(local_path, "rb") as f:
+            return self.put(object_name, f.read(), override=override)
+
+
+def open_store(backend=STORAGE_BACKEND, root=STORAGE_DIR):
+    """Create the object store for the given backend"""
+    if backend == "minio":
+        return MinioStore()
+    if backend == "local":
+        return LocalStore(root)
+    if backend == "memory":
+        return MemoryStore()
+    raise Exception(f"Unsupported storage backend: {backend}")
+
+
+# Store shared by all the handlers of this process
+store = open_store()